@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Startup and per-turn latency benchmarks for Napier.
+
+Runs offline: Gemini is replaced by a local deterministic backend, and the
+MCP side talks to a real server process (the bundled WhatsApp server by
+default). Results are written as JSON with p50/p95/p99 per benchmark so runs
+can be compared across versions.
+
+    python napier_bench.py --runs 20 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import napier_cli
+from napier_cli import NapierClient, MCPServer, ModelBackend, genai
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SERVER = os.path.join(ROOT, "whatsapp-mcp", "whatsapp-mcp-server", "main.py")
+
+def percentiles(samples: List[float]) -> Dict[str, Any]:
+    """Summarize latency samples (seconds) with nearest-rank percentiles in ms"""
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return napier_cli._percentile(ordered, p) * 1000
+
+    return {
+        "runs": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": rank(50),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+        "max_ms": ordered[-1] * 1000
+    }
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini GenerateContentResponse"""
+    def __init__(self, parts: List[Any]):
+        self.parts = parts
+        self.candidates = [genai.protos.Candidate(content=genai.protos.Content(role="model", parts=parts))]
+        self.usage_metadata = None
+
+    @property
+    def text(self) -> str:
+        return "".join(part.text for part in self.parts)
+
+class FakeChat:
+    """Chat session that records history like the Gemini ChatSession"""
+    def __init__(self, history: List[Any]):
+        self.history = history
+
+    @property
+    def history(self) -> List[Any]:
+        return self._history
+
+    @history.setter
+    def history(self, history: List[Any]) -> None:
+        from google.generativeai.types import content_types
+        self._history = list(content_types.to_contents(history))
+
+class FakeBackend(ModelBackend):
+    """
+    Deterministic model backend.
+
+    When tools are offered it calls the configured tool once, then answers
+    with a fixed text after the function response; otherwise it answers
+    directly. An optional fixed latency simulates model time.
+    """
+    def __init__(self, tool_name: Optional[str], tool_args: Dict[str, Any], latency: float = 0.0):
+        self.tool_name = tool_name
+        self.tool_args = tool_args
+        self.latency = latency
+
+    def start_chat(self, history: List[Dict[str, Any]], system_instruction: Optional[str] = None,
+                   cached_content: Any = None):
+        return FakeChat(history)
+
+    async def send_message(self, chat, content, **kwargs):
+        from google.generativeai.types import content_types
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = content_types.to_content(content)
+        message.role = "user"
+
+        # Answer once the function responses come back, so a turn is one round
+        answering = any(part.function_response.name for part in message.parts)
+        if kwargs.get("tools") and self.tool_name and not answering:
+            parts = [genai.protos.Part(function_call=genai.protos.FunctionCall(
+                name=self.tool_name, args=self.tool_args
+            ))]
+        else:
+            parts = [genai.protos.Part(text="Done.")]
+
+        chat.history = list(chat.history) + [message, genai.protos.Content(role="model", parts=parts)]
+        return FakeResponse(parts)
+
+def bench_cold_start(runs: int) -> List[float]:
+    """Wall time of launching napier_cli.py and exiting at the first prompt"""
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench")}
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, "napier_cli.py")],
+            input="/exit\n", text=True, env=env, cwd=ROOT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def bench_handshake(server_path: str, runs: int) -> List[float]:
+    """Time of connect_to_server: spawn, initialize and first list_tools"""
+    samples = []
+    # The first connection is a warm-up that pays for the deferred MCP imports
+    for run in range(runs + 1):
+        client = NapierClient(FakeBackend(None, {}))
+        start = time.perf_counter()
+        if await client.connect_to_server(server_path) is None:
+            raise RuntimeError(f"Could not connect to {server_path}")
+        if run:
+            samples.append(time.perf_counter() - start)
+        await client.cleanup()
+    return samples
+
+async def bench_list_tools(server_path: str, runs: int) -> List[float]:
+    """Round trip of an uncached list_tools request"""
+    server = MCPServer(server_path)
+    await server.start()
+    try:
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            await server.refresh_tools()
+            samples.append(time.perf_counter() - start)
+        return samples
+    finally:
+        await server.close()
+
+async def bench_process_query(server_path: str, runs: int, tool: str, tool_args: Dict[str, Any],
+                              latency: float) -> List[float]:
+    """End-to-end process_query latency, each run in a fresh conversation"""
+    client = NapierClient(FakeBackend(None, tool_args, latency))
+    if await client.connect_to_server(server_path) is None:
+        raise RuntimeError(f"Could not connect to {server_path}")
+    # Route the fake tool call to the first server's namespaced tool
+    client.backend.tool_name = f"{next(iter(client.servers))}__{tool}"
+    try:
+        samples = []
+        # The first query is a warm-up that pays for the deferred Gemini SDK import
+        for run in range(runs + 1):
+            client._chat = None
+            client.chat_preamble = None
+            start = time.perf_counter()
+            await client.process_query("What are my latest chats?")
+            if run:
+                samples.append(time.perf_counter() - start)
+        return samples
+    finally:
+        await client.cleanup()
+
+async def bench_tool_prompt(server_path: str) -> Dict[str, Any]:
+    """Approximate prompt-mode tokens of the tool catalog, indented JSON schemas vs compact signatures"""
+    client = NapierClient(FakeBackend(None, {}))
+    if await client.connect_to_server(server_path) is None:
+        raise RuntimeError(f"Could not connect to {server_path}")
+    try:
+        tools = await client.get_tools()
+        verbose = "".join(
+            f"- {tool.name}: {tool.description}\n  Input schema: {json.dumps(tool.inputSchema, indent=2)}\n\n"
+            for tool in tools
+        )
+        compact = "".join(f"- {napier_cli._tool_signature(tool)}\n" for tool in tools)
+        chars_per_token = napier_cli.HistoryManager.CHARS_PER_TOKEN
+        return {
+            "tools": len(tools),
+            "json_schema_tokens": len(verbose) // chars_per_token,
+            "signature_tokens": len(compact) // chars_per_token,
+            "reduction": 1 - len(compact) / max(len(verbose), 1)
+        }
+    finally:
+        await client.cleanup()
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    results["cold_start"] = percentiles(bench_cold_start(args.runs))
+    results["connect_to_server"] = percentiles(await bench_handshake(args.server, args.runs))
+    results["list_tools"] = percentiles(await bench_list_tools(args.server, args.runs))
+    results["process_query"] = percentiles(await bench_process_query(
+        args.server, args.runs, args.tool, json.loads(args.tool_args), args.model_latency
+    ))
+    results["tool_prompt"] = await bench_tool_prompt(args.server)
+    return {
+        "meta": {
+            "napier_version": "1.0.0",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": os.path.relpath(args.server, ROOT),
+            "runs": args.runs,
+            "model_latency_s": args.model_latency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        },
+        "results": results
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Napier startup and per-turn latency benchmarks")
+    parser.add_argument("--runs", type=int, default=10, help="samples per benchmark")
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="MCP server script to benchmark against")
+    parser.add_argument("--tool", default="list_chats", help="tool the fake model calls in process_query")
+    parser.add_argument("--tool-args", default='{"limit": 5}', help="JSON arguments for --tool")
+    parser.add_argument("--model-latency", type=float, default=0.0,
+                        help="fixed latency in seconds added to each fake model call")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Keep the client's console output out of the measurements, measure
+    # spawned servers rather than ones kept warm by a running daemon, and
+    # planning calls rather than hits in the user's plan cache
+    napier_cli.console.quiet = True
+    os.environ["NAPIER_DAEMON"] = "off"
+    os.environ["NAPIER_PLAN_CACHE"] = "off"
+    report = asyncio.run(run_benchmarks(args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
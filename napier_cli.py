@@ -1,51 +1,1756 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
+import time
+_process_start = time.perf_counter()
+
+import argparse
 import asyncio
+import copy
+import datetime
+import hashlib
+import heapq
+import importlib
+import itertools
+import random
 import sys
 import os
+import threading
 import json
-from typing import Optional, List, Dict, Any
+import math
+import re
+import shlex
+import weakref
+from typing import Optional, List, Dict, Any, Tuple, Callable
+from collections import OrderedDict
 from contextlib import AsyncExitStack
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-
-from dotenv import load_dotenv
-import google.generativeai as genai
 from rich.console import Console
-from rich.markdown import Markdown
-from rich import print as rprint
 from rich.panel import Panel
-from rich.prompt import Prompt
 
-# Load environment variables from .env file
-load_dotenv()
+# Startup cost breakdown reported by --startup-profile
+IMPORT_TIMES: Dict[str, float] = {"eager imports (stdlib, rich.console, rich.panel)": time.perf_counter() - _process_start}
+STARTUP_MARKS: Dict[str, float] = {}
+
+class _LazyModule:
+    """Module proxy that imports the real module on first attribute access"""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            IMPORT_TIMES[self._name] = time.perf_counter() - start
+        return getattr(self._module, attr)
+
+# Heavy dependencies are deferred until first use, so the banner, '/help'
+# and runs that never connect to a server or call Gemini do not pay for them
+genai = _LazyModule("google.generativeai")
+mcp = _LazyModule("mcp")
+mcp_stdio = _LazyModule("mcp.client.stdio")
+types = _LazyModule("mcp.types")
+
+def _mark_startup(stage: str) -> None:
+    """Record the time since process start at which a startup stage was reached"""
+    STARTUP_MARKS.setdefault(stage, time.perf_counter() - _process_start)
+
+def print_startup_profile() -> None:
+    """Print import and startup costs collected during this run"""
+    lines = ["[bold]Imports[/bold]"]
+    for name, elapsed in sorted(IMPORT_TIMES.items(), key=lambda item: -item[1]):
+        lines.append(f"• {name}: {elapsed * 1000:.1f} ms")
+    lines.append("\n[bold]Startup stages (since process start)[/bold]")
+    for stage, elapsed in STARTUP_MARKS.items():
+        lines.append(f"• {stage}: {elapsed * 1000:.1f} ms")
+    console.print(Panel("\n".join(lines), title="Startup Profile", border_style="magenta"))
 
 # Initialize Rich console for better terminal output
 console = Console()
 
+# Turn phases reported with percentiles by '/stats'
+TURN_PHASES = [
+    "total", "catalog_fetch", "prompt_assembly", "model_time", "time_to_first_token",
+    "tool_wall_time", "history_compaction", "digest_wall_time", "rendering"
+]
+
+def _percentile(samples: List[float], percent: float) -> float:
+    """Nearest-rank percentile of a non-empty list of samples"""
+    ordered = sorted(samples)
+    # Rounded first, so float noise (7 / 100 * 100 = 7.000000000000001)
+    # does not push the rank up by one
+    index = max(math.ceil(round(percent / 100 * len(ordered), 9)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+class _NullSpan:
+    """Span returned while tracing is disabled, every operation is a no-op"""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def set(self, **attributes) -> None:
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    """A timed region recorded as a Chrome trace 'complete' event"""
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.attributes)
+        return False
+    
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+class Tracer:
+    """
+    Collects nested spans and writes them in Chrome trace-event format.
+    
+    Each asyncio task gets its own track, so concurrent tool calls show up
+    side by side and spans within a task nest by time. The file can be
+    opened in chrome://tracing or Perfetto. When no path is set, span()
+    returns a shared no-op span and nothing is recorded.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.events: List[Dict[str, Any]] = []
+        self._tracks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._track_count = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+    
+    def span(self, name: str, **attributes):
+        """Context manager timing a region, with attributes shown in the viewer"""
+        if not self.path:
+            return _NULL_SPAN
+        return _Span(self, name, attributes)
+    
+    def _track(self) -> int:
+        """Track id of the current asyncio task, 0 outside of the event loop"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return 0
+        track = self._tracks.get(task)
+        if track is None:
+            self._track_count += 1
+            track = self._tracks[task] = self._track_count
+            self.events.append({
+                "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track,
+                "args": {"name": task.get_name()}
+            })
+        return track
+    
+    def record(self, name: str, start: float, end: float, attributes: Dict[str, Any]) -> None:
+        self.events.append({
+            "name": name,
+            "cat": "napier",
+            "ph": "X",
+            "ts": (start - _process_start) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": self._track(),
+            "args": attributes
+        })
+    
+    def save(self) -> None:
+        """Write the recorded spans to the trace file"""
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+# Name of the local tool that reads truncated tool results in full
+EXPAND_RESULT_TOOL = "napier__expand_result"
+
+# JSON schema keys understood by Gemini function declarations
+GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "items", "properties", "required"}
+
+def _gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce an MCP input schema to the JSON schema subset Gemini accepts"""
+    schema = dict(schema)
+    
+    # Optional[X] arrives as anyOf [X, null]; Gemini wants X with nullable
+    any_of = schema.pop("anyOf", None)
+    if any_of:
+        variants = [variant for variant in any_of if variant.get("type") != "null"]
+        if variants:
+            schema = {**variants[0], **schema}
+        if len(variants) < len(any_of):
+            schema["nullable"] = True
+    
+    # A list of types, e.g. ["string", "null"]: Gemini takes one type
+    if isinstance(schema.get("type"), list):
+        kinds = [kind for kind in schema["type"] if kind != "null"]
+        if len(kinds) < len(schema["type"]):
+            schema["nullable"] = True
+        schema["type"] = kinds[0] if kinds else "string"
+    
+    result = {key: value for key, value in schema.items() if key in GEMINI_SCHEMA_KEYS}
+    result.setdefault("type", "object" if "properties" in result else "string")
+    if result["type"] == "object" and not result.get("properties"):
+        # Gemini rejects a free-form object; it is passed as a JSON string
+        # instead and decoded again by _decode_json_arguments()
+        description = result.get("description")
+        result = {key: value for key, value in result.items() if key in ("nullable", "enum")}
+        result["type"] = "string"
+        result["description"] = f"{description} (a JSON object)" if description else "A JSON object"
+    if result["type"] == "array" and not result.get("items"):
+        result["items"] = {"type": "string"}
+    if "properties" in result:
+        result["properties"] = {name: _gemini_schema(prop) for name, prop in result["properties"].items()}
+    if "items" in result:
+        result["items"] = _gemini_schema(result["items"])
+    return result
+
+def _decode_json_arguments(schema: Dict[str, Any], value: Any) -> Any:
+    """Undo _gemini_schema's JSON-string stand-in for free-form objects in a call's arguments"""
+    if isinstance(value, str):
+        variants = [schema] + [variant for variant in schema.get("anyOf", []) if isinstance(variant, dict)]
+        kinds = {kind for variant in variants
+                 for kind in (variant.get("type") if isinstance(variant.get("type"), list) else [variant.get("type")])}
+        if "object" in kinds and "string" not in kinds:
+            try:
+                decoded = json.loads(value)
+            except ValueError:
+                return value
+            return decoded if isinstance(decoded, dict) else value
+        return value
+    if isinstance(value, dict):
+        properties = schema.get("properties") or {}
+        for variant in schema.get("anyOf", []):
+            if isinstance(variant, dict) and variant.get("properties"):
+                properties = {**variant["properties"], **properties}
+        return {key: _decode_json_arguments(properties[key], item) if key in properties else item
+                for key, item in value.items()}
+    if isinstance(value, list):
+        items = schema.get("items")
+        for variant in schema.get("anyOf", []):
+            if isinstance(variant, dict) and variant.get("items"):
+                items = items or variant["items"]
+        if isinstance(items, dict):
+            return [_decode_json_arguments(items, item) for item in value]
+    return value
+
+# Short names for JSON schema types in compact tool signatures
+SIGNATURE_TYPES = {"string": "str", "integer": "int", "number": "float", "boolean": "bool", "null": "null"}
+
+def _schema_type(schema: Dict[str, Any]) -> str:
+    """Render a JSON schema as a short TypeScript-like type"""
+    if "enum" in schema:
+        return "|".join(json.dumps(value) for value in schema["enum"])
+    variants = schema.get("anyOf") or schema.get("oneOf")
+    if variants:
+        return "|".join(_schema_type(variant) for variant in variants if variant.get("type") != "null")
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        return "|".join(SIGNATURE_TYPES.get(item, item) for item in schema_type if item != "null")
+    if schema_type == "array":
+        return f"list[{_schema_type(schema.get('items', {}))}]" if schema.get("items") else "list"
+    if schema_type == "object" or "properties" in schema:
+        if not schema.get("properties"):
+            return "dict"
+        return "{" + ", ".join(_schema_params(schema)) + "}"
+    return SIGNATURE_TYPES.get(schema_type, schema_type or "any")
+
+def _schema_params(schema: Dict[str, Any]) -> List[str]:
+    """Render object properties as 'name: type', 'name?: type' or 'name: type = default'"""
+    required = set(schema.get("required", []))
+    params = []
+    for name, prop in schema.get("properties", {}).items():
+        if name in required:
+            params.append(f"{name}: {_schema_type(prop)}")
+        elif prop.get("default") is not None:
+            params.append(f"{name}: {_schema_type(prop)} = {json.dumps(prop['default'])}")
+        else:
+            params.append(f"{name}?: {_schema_type(prop)}")
+    return params
+
+def _tool_signature(tool: types.Tool) -> str:
+    """Compact prompt entry for a tool: a one-line signature and its description
+    
+    Replaces the indented JSON schema, dropping titles and other boilerplate,
+    e.g. list_chats(query?: str, limit: int = 20, page: int = 0)
+    """
+    signature = f"{tool.name}({', '.join(_schema_params(tool.inputSchema or {}))})"
+    lines = [line.strip() for line in (tool.description or "").splitlines() if line.strip()]
+    lines += [
+        f"{name}: {prop['description']}"
+        for name, prop in (tool.inputSchema or {}).get("properties", {}).items() if prop.get("description")
+    ]
+    description = "\n".join(f"  {line}" for line in lines)
+    return f"{signature}\n{description}" if description else signature
+
+def _tool_result_text(result: types.CallToolResult) -> str:
+    """Flatten the content of an MCP tool result into text"""
+    parts = []
+    for content in result.content:
+        if isinstance(content, types.TextContent):
+            parts.append(content.text)
+        else:
+            parts.append(content.model_dump_json())
+    return "\n".join(parts)
+
+def _response_text(response) -> str:
+    """Join the text parts of a Gemini response, skipping function calls"""
+    if not response.candidates:
+        return ""
+    return "".join(part.text for part in response.parts if part.text)
+
+def _parse_prompt_tool_calls(text: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Tool calls in a prompt-mode response, written as ```json blocks
+
+    Returns the parsed calls and the number of blocks that were not valid JSON.
+    """
+    calls = []
+    invalid = 0
+    for tool_call_json in re.findall(r"```json\s*(\{[^`]*\})\s*```", text):
+        try:
+            tool_call = json.loads(tool_call_json)
+        except json.JSONDecodeError:
+            invalid += 1
+            continue
+        calls.append({
+            "tool_name": tool_call.get("tool_name"),
+            "parameters": tool_call.get("parameters", {})
+        })
+    return calls, invalid
+
+class ModelBackend:
+    """
+    Async interface between Napier and a chat model.
+
+    Model calls are awaited rather than made synchronously, so the event loop
+    keeps serving MCP traffic (notifications, progress, background tasks)
+    while a generation is in flight.
+    """
+    def start_chat(self, history: List[Dict[str, Any]], system_instruction: Optional[str] = None,
+                   cached_content: Any = None):
+        """Start a chat session seeded with the given history
+        
+        Args:
+            history: Earlier messages of the conversation
+            system_instruction: Stable preamble sent ahead of every request
+            cached_content: Handle from a ContextCache holding the system
+                instruction and tools, used instead of system_instruction
+        """
+        raise NotImplementedError
+    
+    async def send_message(self, chat, content, **kwargs):
+        """Send content on a chat session and return the model response
+
+        With stream=True the response is an async iterable of partial
+        responses; once exhausted it exposes the aggregated parts.
+        """
+        raise NotImplementedError
+
+class GeminiBackend(ModelBackend):
+    """Model backend using the async Gemini API"""
+    def __init__(self, api_key: str, model_name: str = 'gemini-1.5-pro'):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._models: Dict[Optional[str], Any] = {}
+    
+    def model_for(self, system_instruction: Optional[str] = None):
+        """The Gemini model for a system instruction, configured on first use"""
+        if system_instruction not in self._models:
+            if not self._models:
+                genai.configure(api_key=self.api_key)
+            self._models[system_instruction] = genai.GenerativeModel(
+                self.model_name, system_instruction=system_instruction
+            )
+        return self._models[system_instruction]
+    
+    @property
+    def model(self):
+        """The Gemini model without a system instruction"""
+        return self.model_for(None)
+    
+    def start_chat(self, history: List[Dict[str, Any]], system_instruction: Optional[str] = None,
+                   cached_content: Any = None):
+        if cached_content is not None:
+            return genai.GenerativeModel.from_cached_content(cached_content).start_chat(history=history)
+        return self.model_for(system_instruction).start_chat(history=history)
+    
+    async def send_message(self, chat, content, **kwargs):
+        return await chat.send_message_async(content, **kwargs)
+
+class ContextCache:
+    """
+    Provider-side cache of a conversation's stable prefix.
+    
+    The system instruction and tool declarations are registered once per key
+    (a hash of both) and later chats are started from the returned handle, so
+    repeated turns only pay for the new suffix. Entries expire after ttl
+    seconds. Subclasses talk to the provider in create(); a local stub can
+    count creates and hits to check that a prefix is reused.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: Dict[str, Tuple[Any, float]] = {}
+        # Prefixes the provider refused (e.g. below its minimum size)
+        self.rejected: set = set()
+        self.hits = 0
+        self.creates = 0
+    
+    async def get(self, key: str, system_instruction: str, tools: Optional[List[Any]]) -> Optional[Any]:
+        """Handle of the cached prefix for key, created on first use; None if uncacheable"""
+        entry = self.entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        if key in self.rejected:
+            return None
+        try:
+            handle = await self.create(system_instruction, tools)
+        except Exception as e:
+            console.print(f"[dim]Context cache unavailable ({str(e)}), sending the prefix uncached[/dim]")
+            self.rejected.add(key)
+            return None
+        # Renew a little before the provider expires the entry
+        self.entries[key] = (handle, time.monotonic() + self.ttl * 0.9)
+        self.creates += 1
+        return handle
+    
+    async def create(self, system_instruction: str, tools: Optional[List[Any]]) -> Any:
+        """Register a prefix with the provider and return its handle"""
+        raise NotImplementedError
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "creates": self.creates, "entries": len(self.entries)}
+
+class GeminiContextCache(ContextCache):
+    """Context cache using Gemini's cached-content API"""
+    def __init__(self, backend: GeminiBackend, ttl: float):
+        super().__init__(ttl)
+        self.backend = backend
+    
+    async def create(self, system_instruction: str, tools: Optional[List[Any]]) -> Any:
+        # Configures the API key on first use
+        self.backend.model_for(None)
+        return await asyncio.to_thread(
+            genai.caching.CachedContent.create,
+            model=self.backend.model_name,
+            system_instruction=system_instruction,
+            tools=tools,
+            ttl=datetime.timedelta(seconds=self.ttl)
+        )
+
+# Tool-use instructions appended to the system instruction while servers are
+# connected, per tool mode. They never change, so the prefix stays byte-stable
+NATIVE_TOOL_INSTRUCTIONS = """You can help users interact with various applications through tools.
+If a tool is needed to fulfill the request, call it. Call every tool whose inputs you already know at once;
+only wait for results when a call needs the output of another one.
+After receiving tool results, provide a helpful response that incorporates the information.
+If no tool is needed, respond directly to the user's request."""
+
+PROMPT_TOOL_INSTRUCTIONS = """You can help users interact with various applications through tools.
+The tools you have access to are listed in the conversation.
+
+INSTRUCTIONS:
+1. Analyze the user's request carefully.
+2. If a tool is needed to fulfill the request, decide which tool to use.
+3. Format your tool calls as JSON, wrapped in triple backticks with the 'json' tag.
+4. Example tool call format:
+```json
+{
+  "tool_name": "tool_name_here",
+  "parameters": {
+    "param1": "value1",
+    "param2": "value2"
+  }
+}
+```
+5. After receiving tool results, provide a helpful response that incorporates the information.
+6. If no tool is needed, respond directly to the user's request.
+
+Always make sure to follow the exact signature of each tool when making a call."""
+
+class RequestScheduler:
+    """
+    Shared admission control and retry policy for model requests.
+    
+    Requests wait for a token bucket refilled from the configured requests
+    and tokens per minute (0 disables a limit) and are admitted in priority
+    order, so interactive turns go ahead of queued background work. Quota
+    (429) and server (5xx) errors are retried with exponential backoff and
+    jitter; a 429 also pauses admission for everyone until the backoff ends.
+    """
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._request_budget = float(rpm)
+        self._token_budget = float(tpm)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting: List[Tuple[int, int]] = []
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.requests = 0
+        self.retries = 0
+        self.wait_time = 0.0
+    
+    @staticmethod
+    def retryable(error: Exception) -> bool:
+        """Whether an error is a quota (429) or server (5xx) error"""
+        code = getattr(error, "code", None)
+        return isinstance(code, int) and (code == 429 or 500 <= code < 600)
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._refilled
+        self._refilled = now
+        if self.rpm:
+            self._request_budget = min(self.rpm, self._request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_budget = min(self.tpm, self._token_budget + elapsed * self.tpm / 60)
+    
+    def _admission_delay(self, tokens: int) -> float:
+        """Seconds until a request of the given size fits the budgets"""
+        delay = self._paused_until - time.monotonic()
+        if self.rpm and self._request_budget < 1:
+            delay = max(delay, (1 - self._request_budget) * 60 / self.rpm)
+        # A request larger than the whole bucket waits for a full bucket
+        needed = min(tokens, self.tpm)
+        if self.tpm and self._token_budget < needed:
+            delay = max(delay, (needed - self._token_budget) * 60 / self.tpm)
+        return delay
+    
+    def _notify(self) -> None:
+        """Wake waiting requests to re-check their turn"""
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+    
+    async def acquire(self, tokens: int = 0, priority: int = INTERACTIVE) -> None:
+        """Wait until a request may be sent and take it out of the budgets"""
+        start = time.perf_counter()
+        entry = (priority, next(self._order))
+        heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                self._refill()
+                delay = self._admission_delay(tokens) if self._waiting[0] == entry else None
+                if delay is not None and delay <= 0:
+                    break
+                wakeup = self._wakeup
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self._notify()
+        
+        if self.rpm:
+            self._request_budget -= 1
+        if self.tpm:
+            self._token_budget -= tokens
+        self.wait_time += time.perf_counter() - start
+    
+    def charge(self, tokens: int) -> None:
+        """Take tokens known only after a response (e.g. output) out of the budget"""
+        if self.tpm:
+            self._refill()
+            self._token_budget -= tokens
+    
+    async def submit(self, request, tokens: int = 0, priority: int = INTERACTIVE):
+        """Send a request, retrying quota and server errors with backoff
+        
+        Args:
+            request: Zero-argument callable returning the request coroutine
+            tokens: Estimated input tokens of the request
+            priority: INTERACTIVE or BACKGROUND
+        """
+        for attempt in itertools.count():
+            await self.acquire(tokens, priority)
+            self.requests += 1
+            try:
+                return await request()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.retryable(e):
+                    raise
+                # Exponential backoff with equal jitter
+                cap = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay = cap / 2 + random.uniform(0, cap / 2)
+                self.retries += 1
+                console.print(f"[yellow]Model request failed ({str(e)}), "
+                              f"retrying in {delay:.1f}s...[/yellow]")
+                if e.code == 429:
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self._notify()
+                else:
+                    await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "wait_time": self.wait_time,
+            "queued": len(self._waiting)
+        }
+
+def _content_text(content) -> str:
+    """Render a chat history entry as plain text, including tool traffic"""
+    parts = []
+    for part in content.parts:
+        if part.text:
+            parts.append(part.text)
+        elif part.function_call.name:
+            args = genai.protos.FunctionCall.to_dict(part.function_call).get("args", {})
+            parts.append(f"[call {part.function_call.name}({json.dumps(args)})]")
+        elif part.function_response.name:
+            response = genai.protos.FunctionResponse.to_dict(part.function_response).get("response", {})
+            parts.append(f"[result {part.function_response.name}: {json.dumps(response)}]")
+    return "\n".join(parts)
+
+class HistoryManager:
+    """
+    Keeps the chat history within a token budget.
+
+    The last keep_turns turns are kept verbatim; once the history grows past
+    token_budget, older turns are folded into a rolling summary that takes
+    their place at the start of the history.
+    """
+    # Rough characters-per-token ratio, avoids a count_tokens round trip
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self, backend: ModelBackend, token_budget: int, keep_turns: int,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.backend = backend
+        self.scheduler = scheduler or RequestScheduler()
+        self.token_budget = token_budget
+        self.keep_turns = max(keep_turns, 1)
+        self.compactions = 0
+        self.summarized_turns = 0
+    
+    def estimate_tokens(self, history: List[Any]) -> int:
+        """Estimate the token count of a chat history"""
+        return sum(len(_content_text(content)) for content in history) // self.CHARS_PER_TOKEN
+    
+    def size_bytes(self, history: List[Any]) -> int:
+        """Serialized size of a chat history in bytes"""
+        return sum(len(genai.protos.Content.serialize(content)) for content in history)
+    
+    @staticmethod
+    def split_turns(history: List[Any]) -> List[List[Any]]:
+        """Group history entries into turns, each starting at a user text message"""
+        turns = []
+        for content in history:
+            if not turns or (content.role == "user" and any(part.text for part in content.parts)):
+                turns.append([])
+            turns[-1].append(content)
+        return turns
+    
+    async def compact(self, chat, record_usage: Optional[Callable[[Any, float], None]] = None) -> bool:
+        """Fold older turns into the rolling summary if over budget
+
+        record_usage, if given, is called with the summarization response and
+        its elapsed time. Returns True if the history was rewritten.
+        """
+        history = list(chat.history)
+        turns = self.split_turns(history)
+        if len(turns) <= self.keep_turns or self.estimate_tokens(history) <= self.token_budget:
+            return False
+        
+        older, recent = turns[:-self.keep_turns], turns[-self.keep_turns:]
+        transcript = "\n".join(
+            f"{content.role}: {_content_text(content)}" for turn in older for content in turn
+        )
+        prompt = f"""Summarize the following conversation between a user and an AI assistant.
+Keep facts, names, identifiers, decisions and tool results that later messages may rely on.
+If it starts with an earlier summary, merge it into the new one. Be compact.
+
+{transcript}"""
+        
+        try:
+            start = time.perf_counter()
+            response = await self.scheduler.submit(
+                lambda: self.backend.send_message(
+                    self.backend.start_chat([]),
+                    prompt,
+                    generation_config={"temperature": 0.2}
+                ),
+                tokens=len(prompt) // self.CHARS_PER_TOKEN,
+                priority=RequestScheduler.BACKGROUND
+            )
+            if record_usage:
+                record_usage(response, time.perf_counter() - start)
+            summary = _response_text(response)
+        except Exception as e:
+            console.print(f"[bold red]Error summarizing history: {str(e)}[/bold red]")
+            return False
+        
+        chat.history = [
+            {"role": "user", "parts": [f"Summary of the earlier conversation:\n{summary}"]},
+            {"role": "model", "parts": ["Understood."]},
+        ] + [content for turn in recent for content in turn]
+        self.compactions += 1
+        self.summarized_turns += len(older)
+        return True
+    
+    def stats(self, history: List[Any]) -> Dict[str, Any]:
+        """Current history size and compaction counters"""
+        return {
+            "turns": len(self.split_turns(history)),
+            "messages": len(history),
+            "tokens": self.estimate_tokens(history),
+            "bytes": self.size_bytes(history),
+            "token_budget": self.token_budget,
+            "compactions": self.compactions,
+            "summarized_turns": self.summarized_turns
+        }
+
+class PlanCache:
+    """
+    On-disk cache of model tool plans for tool-routing turns.
+
+    A plan is the list of tool calls the model chose for a query. Entries are
+    keyed by a hash of the tool catalog, the normalized query and a
+    fingerprint of the recent history, expire after ttl seconds and are
+    evicted least recently used once there are more than max_entries.
+    """
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        import sqlite3
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS plans "
+            "(key TEXT PRIMARY KEY, plan TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+    
+    @staticmethod
+    def make_key(catalog_hash: str, query: str, history_fingerprint: str) -> str:
+        """Build a cache key from the catalog, the query and the recent history"""
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256(f"{catalog_hash}\0{normalized}\0{history_fingerprint}".encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached plan for key, or None if missing or expired"""
+        now = time.time()
+        row = self.db.execute("SELECT plan, created FROM plans WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE plans SET last_used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return json.loads(row[0])
+    
+    def put(self, key: str, plan: List[Dict[str, Any]]) -> None:
+        """Store a plan, then drop expired and least recently used entries"""
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO plans (key, plan, created, last_used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(plan), now, now)
+        )
+        self.db.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM plans WHERE key NOT IN (SELECT key FROM plans ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        self.db.commit()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters and current number of entries"""
+        entries = self.db.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+def _canonical_args(arguments: Dict[str, Any]) -> str:
+    """Serialize tool arguments canonically, so equivalent calls compare equal"""
+    def normalize(value):
+        # Gemini sends integers as floats (20.0), MCP callers as ints (20)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        return value
+    return json.dumps(normalize(arguments), sort_keys=True, separators=(",", ":"))
+
+def _split_result_items(text: str):
+    """Split a tool result into items that can be dropped individually
+
+    Returns the item strings and a function that rebuilds a result from a
+    head, an omitted-item count and a tail, or ([], None) if the result has
+    no list structure.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    
+    if isinstance(data, list):
+        def rejoin(head, omitted, tail):
+            return "[" + ",\n".join(head + [json.dumps(f"... {omitted} items omitted ...")] + tail) + "]"
+        return [json.dumps(item) for item in data], rejoin
+    
+    if isinstance(data, dict):
+        # Shape the largest list in the object, keep the other fields
+        lists = [key for key, value in data.items() if isinstance(value, list)]
+        if not lists:
+            return [], None
+        key = max(lists, key=lambda name: len(json.dumps(data[name])))
+        def rejoin(head, omitted, tail):
+            items = [json.loads(item) for item in head] + [f"... {omitted} items omitted ..."] + [json.loads(item) for item in tail]
+            return json.dumps({**data, key: items})
+        return [json.dumps(item) for item in data[key]], rejoin
+    
+    # Several JSON values, one per tool content item
+    decoder = json.JSONDecoder()
+    items = []
+    position = 0
+    while position < len(text):
+        try:
+            _, end = decoder.raw_decode(text, position)
+        except ValueError:
+            items = []
+            break
+        items.append(text[position:end])
+        position = end
+        while position < len(text) and text[position].isspace():
+            position += 1
+    if len(items) < 2:
+        items = text.splitlines()
+    
+    def rejoin(head, omitted, tail):
+        return "\n".join(head + [f"... {omitted} items omitted ..."] + tail)
+    return items, rejoin
+
+def _shape_result(text: str, budget: int) -> str:
+    """Structurally truncate a tool result to about budget bytes
+
+    Keeps the first and last items of list-shaped results (about two thirds
+    of the budget for the head) with a count of what was omitted in between,
+    falling back to a head and tail of the raw text. A budget of 0 or less
+    leaves the text as it is.
+    """
+    data = text.encode()
+    if budget <= 0 or len(data) <= budget:
+        return text
+    
+    items, rejoin = _split_result_items(text)
+    if len(items) > 1:
+        sizes = [len(item.encode()) + 2 for item in items]
+        first, last = 0, len(items) - 1
+        used = 0
+        while first <= last and used + sizes[first] <= budget * 2 // 3:
+            used += sizes[first]
+            first += 1
+        while last >= first and used + sizes[last] <= budget:
+            used += sizes[last]
+            last -= 1
+        if first > 0 or last < len(items) - 1:
+            return rejoin(items[:first], last - first + 1, items[last + 1:])
+    
+    # Cut by bytes; a multi-byte character split at either cut is dropped
+    head = budget * 2 // 3
+    tail = budget - head
+    return (f"{data[:head].decode(errors='ignore')}\n... {len(data) - head - tail} bytes omitted ...\n"
+            f"{data[len(data) - tail:].decode(errors='ignore')}")
+
+# Words too common in queries and tool descriptions to tell tools apart
+SEARCH_STOPWORDS = frozenset(
+    "a about an and any are as at be by can could did do does for from has have how i if in into is it "
+    "its me my of on or our please said say so that the their them then there these this those to was "
+    "we what when where which who whom why will with would you your".split()
+)
+
+def _search_terms(text: str) -> List[str]:
+    """Lowercase word terms, splitting snake_case and camelCase identifiers
+
+    Stopwords are dropped and plurals are folded into the singular, so
+    "messages" matches "message".
+    """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text.lower()):
+        if term in SEARCH_STOPWORDS:
+            continue
+        if len(term) > 4 and term.endswith("ies"):
+            term = term[:-3] + "y"
+        elif len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+class ToolIndex:
+    """
+    In-memory BM25 index over a tool catalog.
+    
+    Each tool is indexed by its name (counted twice, names are the strongest
+    signal), description and parameter names, so a query can be matched to
+    the few tools relevant to it without asking the model.
+    """
+    K1 = 1.5
+    B = 0.75
+    
+    def __init__(self, tools: List[types.Tool]):
+        self.names = [tool.name for tool in tools]
+        self.documents: List[Dict[str, int]] = []
+        for tool in tools:
+            bare_name = tool.name.split("__", 1)[-1]
+            terms = _search_terms(bare_name) * 2 + _search_terms(tool.description or "")
+            for param in (tool.inputSchema or {}).get("properties", {}):
+                terms += _search_terms(param)
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            self.documents.append(counts)
+        
+        self.lengths = [sum(counts.values()) for counts in self.documents]
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+        frequencies: Dict[str, int] = {}
+        for counts in self.documents:
+            for term in counts:
+                frequencies[term] = frequencies.get(term, 0) + 1
+        total = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in frequencies.items()
+        }
+    
+    def scores(self, query: str) -> List[float]:
+        """BM25 score of every tool for the query, in catalog order"""
+        terms = set(_search_terms(query))
+        scores = []
+        for counts, length in zip(self.documents, self.lengths):
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    norm = self.K1 * (1 - self.B + self.B * length / max(self.average_length, 1e-9))
+                    score += self.idf[term] * frequency * (self.K1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+    
+    def top(self, query: str, k: int) -> List[str]:
+        """Names of the k best matching tools, or [] if nothing matches the query"""
+        ranked = sorted(zip(self.scores(query), range(len(self.names))), key=lambda item: (-item[0], item[1]))
+        return [self.names[index] for score, index in ranked[:k] if score > 0]
+
+def _tool_prompt_size(tools: List[types.Tool]) -> int:
+    """Approximate prompt characters spent on describing the given tools"""
+    return sum(
+        len(tool.name) + len(tool.description or "") + len(json.dumps(tool.inputSchema, separators=(",", ":")))
+        for tool in tools
+    )
+
+class ToolResultCache:
+    """
+    In-memory TTL cache for results of read-only tool calls.
+
+    Entries are keyed by server, tool and canonical arguments, expire after
+    a per-tool TTL and are evicted least recently used once the cached
+    results exceed max_bytes.
+    """
+    def __init__(self, default_ttl: float, ttls: Dict[str, float], max_bytes: int):
+        self.default_ttl = default_ttl
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries: OrderedDict[Tuple[str, str, str], Tuple[float, str]] = OrderedDict()
+    
+    def ttl(self, server: str, tool: str) -> float:
+        """TTL for a tool, looked up by namespaced then bare tool name"""
+        return self.ttls.get(f"{server}__{tool}", self.ttls.get(tool, self.default_ttl))
+    
+    def get(self, key: Tuple[str, str, str]) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, key: Tuple[str, str, str], result: str) -> None:
+        if key in self.entries:
+            self._remove(key)
+        size = len(result.encode())
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl(key[0], key[1]), result)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+    
+    def invalidate_server(self, server: str) -> None:
+        """Drop all results of a server, e.g. after one of its tools changed state"""
+        for key in [key for key in self.entries if key[0] == server]:
+            self._remove(key)
+    
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        _, result = self.entries.pop(key)
+        self.size -= len(result.encode())
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.size}
+
+def _server_options_from_env() -> Dict[str, float]:
+    """MCPServer health settings from the environment
+    
+    NAPIER_PING_INTERVAL: seconds between heartbeat pings (0 disables them)
+    NAPIER_TOOL_TIMEOUT: seconds a tool call may take (0 for no limit)
+    NAPIER_RECONNECT_BACKOFF_MAX: longest wait between restart attempts
+    """
+    return {
+        "ping_interval": float(os.getenv("NAPIER_PING_INTERVAL", "15")),
+        "call_timeout": float(os.getenv("NAPIER_TOOL_TIMEOUT", "60")),
+        "max_backoff": float(os.getenv("NAPIER_RECONNECT_BACKOFF_MAX", "30"))
+    }
+
+async def _wait_any(*events: asyncio.Event) -> None:
+    """Wait until one of the events is set"""
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+class MCPServer:
+    """
+    A connection to one MCP server process.
+    
+    The stdio transport and ClientSession are entered and exited inside a
+    dedicated task, so several servers can be started concurrently and
+    closed independently without crossing anyio cancel scopes.
+    
+    The task also supervises the server: it pings it every ping_interval
+    seconds, and when a ping or a call finds it dead or hung, the process is
+    killed and respawned with capped exponential backoff. Tool calls time
+    out after call_timeout seconds; calls to idempotent tools that fail
+    because of the server are retried once on the new process.
+    """
+    # Seconds a heartbeat ping may take before the server counts as hung
+    PING_TIMEOUT = 5.0
+    
+    def __init__(self, server_script_path: str, ping_interval: float = 15.0,
+                 call_timeout: float = 60.0, max_backoff: float = 30.0):
+        is_python = server_script_path.endswith('.py')
+        is_js = server_script_path.endswith('.js')
+        if not (is_python or is_js):
+            raise ValueError("Server script must be a .py or .js file")
+        
+        self.path = server_script_path
+        self.params = mcp.StdioServerParameters(
+            command="python" if is_python else "node",  # Python or Node interpreter
+            args=[server_script_path],                   # Path to server script
+            env=None                                     # Use current environment
+        )
+        self.name: Optional[str] = None
+        self.session: Optional[mcp.ClientSession] = None
+        
+        # Tool catalog cache, marked stale on notifications/tools/list_changed
+        self.tools: Optional[List[types.Tool]] = None
+        self.tools_stale = False
+        
+        # Called when the server reports notifications/tools/list_changed
+        self.on_tools_changed: Optional[Callable[[], None]] = None
+        # Called after the server went down or came back up
+        self.on_health_changed: Optional[Callable[[], None]] = None
+        
+        self.ping_interval = ping_interval
+        self.call_timeout = call_timeout
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+        self.downtime = 0.0
+        self._down_since: Optional[float] = None
+        
+        self._connected = asyncio.Event()
+        # Set when the current connection ends, failing its pending requests
+        self._lost = asyncio.Event()
+        self._unhealthy = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        """Spawn the server and complete the MCP handshake"""
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        try:
+            await ready
+        except asyncio.CancelledError:
+            # Abandoned mid-handshake, stop the server before it becomes orphaned
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            raise
+    
+    async def _run(self, ready: asyncio.Future) -> None:
+        attempt = 0
+        while not self._closing.is_set():
+            try:
+                async with AsyncExitStack() as stack:
+                    read, write = await stack.enter_async_context(mcp_stdio.stdio_client(self.params))
+                    session = await stack.enter_async_context(
+                        mcp.ClientSession(read, write, message_handler=self._handle_message)
+                    )
+                    result = await session.initialize()
+                    self._lost = asyncio.Event()
+                    self.session = session
+                    self._unhealthy.clear()
+                    self._connected.set()
+                    attempt = 0
+                    if not ready.done():
+                        self.name = result.serverInfo.name
+                        ready.set_result(None)
+                    else:
+                        self._reconnected()
+                    
+                    heartbeat = asyncio.create_task(self._heartbeat(session)) if self.ping_interval else None
+                    try:
+                        await _wait_any(self._closing, self._unhealthy)
+                    finally:
+                        self._connected.clear()
+                        self._lost.set()
+                        self.session = None
+                        if heartbeat:
+                            heartbeat.cancel()
+            except asyncio.CancelledError:
+                # The transport also cancels this task when the server process
+                # dies; only a cancellation of the task itself is a shutdown
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+                    return
+                # Tearing down a respawned transport on close() can raise;
+                # that is not a failure worth reporting
+                if self._closing.is_set():
+                    return
+                console.print(f"[yellow]Server '{self.name}' failed ({str(e) or type(e).__name__})[/yellow]")
+            
+            # A shutdown whose cancellation the transport's cancel scope swallowed
+            if asyncio.current_task().cancelling():
+                raise asyncio.CancelledError
+            if not ready.done():
+                ready.set_exception(ConnectionError("Server exited during the MCP handshake"))
+                return
+            if self._closing.is_set():
+                return
+            self._went_down()
+            # Capped exponential backoff between restarts
+            delay = min(self.max_backoff, 0.5 * 2 ** attempt)
+            attempt += 1
+            console.print(f"[yellow]Restarting server '{self.name}' in {delay:.1f}s...[/yellow]")
+            try:
+                await asyncio.wait_for(self._closing.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _went_down(self) -> None:
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+            if self.on_health_changed:
+                self.on_health_changed()
+    
+    def _reconnected(self) -> None:
+        self.reconnects += 1
+        if self._down_since is not None:
+            self.downtime += time.monotonic() - self._down_since
+            self._down_since = None
+        # The new process may serve a different catalog
+        self.tools_stale = True
+        console.print(f"[green]Reconnected to server '{self.name}'[/green]")
+        if self.on_tools_changed:
+            self.on_tools_changed()
+        if self.on_health_changed:
+            self.on_health_changed()
+    
+    def mark_unhealthy(self) -> None:
+        """Restart the server process in the background"""
+        if self._connected.is_set():
+            # New calls wait for the restart instead of using the old session
+            self._connected.clear()
+            self._went_down()
+            self._unhealthy.set()
+    
+    async def _ping(self, session: mcp.ClientSession) -> bool:
+        """Whether the server answers a ping in time"""
+        try:
+            await asyncio.wait_for(session.send_ping(), self.PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+    
+    async def _heartbeat(self, session: mcp.ClientSession) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if not await self._ping(session):
+                console.print(f"[yellow]Server '{self.name}' stopped answering pings[/yellow]")
+                self.mark_unhealthy()
+                return
+    
+    async def _wait_connected(self) -> mcp.ClientSession:
+        """The live session, waiting up to call_timeout for a restart to finish"""
+        if not self._connected.is_set():
+            if self._task is None or self._task.done():
+                raise ConnectionError(f"Server '{self.name}' is closed")
+            try:
+                await asyncio.wait_for(self._connected.wait(), self.call_timeout or None)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"Server '{self.name}' is down, reconnecting in the background") from None
+        return self.session
+    
+    async def _request(self, request):
+        """Await a session request for up to call_timeout seconds
+
+        Fails as soon as the connection is lost instead of waiting out the
+        timeout on a session whose process is gone.
+        """
+        lost = self._lost
+        call = asyncio.ensure_future(request)
+        waiter = asyncio.ensure_future(lost.wait())
+        try:
+            done, _ = await asyncio.wait({call, waiter}, timeout=self.call_timeout or None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not call.done():
+                call.cancel()
+        if call in done:
+            return call.result()
+        if lost.is_set():
+            raise ConnectionError(f"Lost the connection to server '{self.name}'")
+        raise asyncio.TimeoutError
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any],
+                        idempotent: bool = False) -> types.CallToolResult:
+        """Call a tool with a timeout, checking the server's health on failure
+        
+        Args:
+            name: Tool name on this server
+            arguments: Tool arguments
+            idempotent: Retry once on the restarted server if the call failed
+                because the server died or hung
+        """
+        for attempt in range(2):
+            session = await self._wait_connected()
+            try:
+                return await self._request(session.call_tool(name, arguments))
+            except Exception as e:
+                error = e
+                if isinstance(e, asyncio.TimeoutError):
+                    error = TimeoutError(f"Tool '{name}' timed out after {self.call_timeout:g}s")
+                # A server that still answers pings failed only this call
+                if self._closing.is_set() or (session is self.session and await self._ping(session)):
+                    raise error from e
+                if session is self.session:
+                    self.mark_unhealthy()
+                if attempt or not idempotent:
+                    raise ConnectionError(
+                        f"Server '{self.name}' failed during '{name}' ({str(error) or type(e).__name__}), restarting it"
+                    ) from e
+                console.print(f"[yellow]Retrying '{name}' once the server '{self.name}' is back...[/yellow]")
+    
+    def health(self) -> Dict[str, Any]:
+        """Whether the server is up, with its restart count and total downtime"""
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {"up": self._down_since is None, "reconnects": self.reconnects, "downtime": downtime}
+    
+    async def _handle_message(self, message) -> None:
+        """Handle incoming messages from the MCP server"""
+        notification = getattr(message, "root", message)
+        if isinstance(notification, types.ToolListChangedNotification):
+            # Refetch lazily on next access instead of inside the reader task
+            self.tools_stale = True
+            if self.on_tools_changed:
+                self.on_tools_changed()
+    
+    async def refresh_tools(self) -> List[types.Tool]:
+        """Fetch the tool catalog from the server"""
+        session = await self._wait_connected()
+        response = await self._request(session.list_tools())
+        self.tools = response.tools
+        self.tools_stale = False
+        return self.tools
+    
+    async def close(self) -> None:
+        """Shut down the session and the server process"""
+        self._closing.set()
+        if self._task:
+            await self._task
+
+def _server_name(name: Optional[str], taken) -> str:
+    """Normalize a server's reported name and make it unique among taken names"""
+    base_name = re.sub(r"[^a-z0-9_]+", "_", (name or "server").lower()).strip("_") or "server"
+    unique_name = base_name
+    suffix = 2
+    while unique_name in taken:
+        unique_name = f"{base_name}_{suffix}"
+        suffix += 1
+    return unique_name
+
+# Longest daemon protocol message, large tool results travel as one line
+DAEMON_LINE_LIMIT = 64 * 1024 * 1024
+
+def _default_socket_path() -> str:
+    """Unix socket of the Napier daemon, overridable with NAPIER_SOCKET"""
+    return os.getenv("NAPIER_SOCKET") or os.path.join(
+        os.path.expanduser("~"), ".cache", "napier", "napier.sock"
+    )
+
+class NapierDaemon:
+    """
+    Keeps MCP servers warm across Napier invocations.
+    
+    The daemon owns the server processes and their ClientSessions and serves
+    them to short-lived clients over a Unix socket, one JSON message per line.
+    Clients send {"id", "method", "params"} requests (connect, list_tools,
+    call_tool) and get {"id", "result"} or {"id", "error"} back; tool list
+    changes are pushed to every client as {"event": "tools_changed"}.
+    A server connected once stays up for later clients until the daemon exits.
+    """
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.servers: Dict[str, MCPServer] = {}
+        # Server name by absolute script path, and connections in progress
+        self.paths: Dict[str, str] = {}
+        self.connecting: Dict[str, asyncio.Task] = {}
+        self.writers: set = set()
+        self.exit_stack = AsyncExitStack()
+        self.server_options = _server_options_from_env()
+    
+    async def connect(self, path: str) -> MCPServer:
+        """Return the server for a script, starting it on first use"""
+        path = os.path.abspath(path)
+        if path in self.paths:
+            return self.servers[self.paths[path]]
+        if path not in self.connecting:
+            self.connecting[path] = asyncio.create_task(self._start_server(path))
+        # Shielded, so a client going away does not abort a start others wait for
+        return await asyncio.shield(self.connecting[path])
+    
+    async def _start_server(self, path: str) -> MCPServer:
+        try:
+            server = MCPServer(path, **self.server_options)
+            await server.start()
+            self.exit_stack.push_async_callback(server.close)
+            await server.refresh_tools()
+            server.name = _server_name(server.name, self.servers)
+            server.on_tools_changed = lambda: self._broadcast({"event": "tools_changed", "server": server.name})
+            server.on_health_changed = lambda: self._broadcast(
+                {"event": "health_changed", "server": server.name, "health": server.health()}
+            )
+            self.servers[server.name] = server
+            self.paths[path] = server.name
+            console.print(f"[green]Serving '{server.name}' ({path})[/green]")
+            return server
+        finally:
+            del self.connecting[path]
+    
+    def _broadcast(self, message: Dict[str, Any]) -> None:
+        data = (json.dumps(message) + "\n").encode()
+        for writer in list(self.writers):
+            writer.write(data)
+    
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "connect":
+            server = await self.connect(params["path"])
+            return {"name": server.name, "tools": [tool.model_dump(mode="json") for tool in server.tools],
+                    "health": server.health()}
+        
+        server = self.servers.get(params.get("server"))
+        if server is None:
+            raise ValueError(f"Unknown server '{params.get('server')}'")
+        if method == "list_tools":
+            if params.get("refresh") or server.tools is None or server.tools_stale:
+                await server.refresh_tools()
+            return {"tools": [tool.model_dump(mode="json") for tool in server.tools]}
+        if method == "call_tool":
+            result = await server.call_tool(params["tool"], params.get("arguments") or {},
+                                            idempotent=bool(params.get("idempotent")))
+            return result.model_dump(mode="json")
+        raise ValueError(f"Unknown method '{method}'")
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.writers.add(writer)
+        
+        async def respond(request: Dict[str, Any]) -> None:
+            try:
+                response = {"id": request["id"], "result": await self._dispatch(request["method"], request.get("params", {}))}
+            except Exception as e:
+                response = {"id": request["id"], "error": str(e)}
+            writer.write((json.dumps(response) + "\n").encode())
+        
+        # Requests are served concurrently, responses are matched by id
+        pending = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(respond(json.loads(line)))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            self.writers.discard(writer)
+            for task in pending:
+                task.cancel()
+            writer.close()
+    
+    async def serve(self, server_script_paths: List[str]) -> None:
+        """Listen on the socket until cancelled, pre-starting the given servers"""
+        # The socket hands out every tool (sending messages included), so
+        # only the owner may reach it. The directory may already exist (the
+        # plan cache shares it), so its mode is set rather than assumed
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        os.chmod(socket_dir, 0o700)
+        running = await DaemonClient.attach(self.socket_path)
+        if running is not None:
+            await running.close()
+            raise RuntimeError(f"A Napier daemon is already listening on {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        
+        # Bind under a private umask so the socket is never reachable by others
+        umask = os.umask(0o077)
+        try:
+            listener = await asyncio.start_unix_server(self._handle_client, path=self.socket_path,
+                                                       limit=DAEMON_LINE_LIMIT)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        console.print(f"[green]Napier daemon listening on {self.socket_path}[/green]")
+        try:
+            results = await asyncio.gather(*(self.connect(path) for path in server_script_paths),
+                                           return_exceptions=True)
+            for path, result in zip(server_script_paths, results):
+                if isinstance(result, Exception):
+                    console.print(f"[bold red]Error starting {path}: {str(result)}[/bold red]")
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            await self.exit_stack.aclose()
+
+class DaemonClient:
+    """Connection from a Napier client to a running daemon"""
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.servers: Dict[str, RemoteServer] = {}
+        self._ids = itertools.count()
+        self._reader_task = asyncio.create_task(self._read())
+    
+    @classmethod
+    async def attach(cls, socket_path: str) -> Optional[DaemonClient]:
+        """Connect to the daemon on socket_path, or None if none is running"""
+        try:
+            reader, writer = await asyncio.open_unix_connection(socket_path, limit=DAEMON_LINE_LIMIT)
+        except OSError:
+            return None
+        return cls(reader, writer)
+    
+    async def _read(self) -> None:
+        try:
+            while line := await self.reader.readline():
+                message = json.loads(line)
+                if message.get("event") == "tools_changed":
+                    server = self.servers.get(message["server"])
+                    if server:
+                        server.tools_stale = True
+                    continue
+                if message.get("event") == "health_changed":
+                    server = self.servers.get(message["server"])
+                    if server:
+                        server.health_report = message["health"]
+                    continue
+                future = self.pending.pop(message["id"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(RuntimeError(message["error"]))
+                else:
+                    future.set_result(message["result"])
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost connection to the Napier daemon"))
+            self.pending.clear()
+    
+    async def request(self, method: str, **params) -> Any:
+        """Send a request to the daemon and wait for its result"""
+        if self._reader_task.done():
+            raise ConnectionError("Lost connection to the Napier daemon")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write((json.dumps({"id": request_id, "method": method, "params": params}) + "\n").encode())
+        await self.writer.drain()
+        return await future
+    
+    async def connect(self, path: str) -> RemoteServer:
+        """Get a server from the daemon, which starts it if it is not running yet"""
+        result = await self.request("connect", path=os.path.abspath(path))
+        server = RemoteServer(self, result["name"], path)
+        server.tools = [types.Tool.model_validate(tool) for tool in result["tools"]]
+        server.health_report = result["health"]
+        self.servers[server.remote_name] = server
+        return server
+    
+    async def close(self) -> None:
+        self._reader_task.cancel()
+        self.writer.close()
+
+class RemoteServer:
+    """A server owned by the Napier daemon, used like a local MCPServer"""
+    def __init__(self, daemon: DaemonClient, remote_name: str, path: str):
+        self.daemon = daemon
+        self.remote_name = remote_name
+        self.name: Optional[str] = remote_name
+        self.path = path
+        self.tools: Optional[List[types.Tool]] = None
+        self.tools_stale = False
+        # Pushed by the daemon, which supervises the server process
+        self.health_report: Dict[str, Any] = {"up": True, "reconnects": 0, "downtime": 0.0}
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any],
+                        idempotent: bool = False) -> types.CallToolResult:
+        result = await self.daemon.request(
+            "call_tool", server=self.remote_name, tool=name, arguments=arguments, idempotent=idempotent
+        )
+        return types.CallToolResult.model_validate(result)
+    
+    def health(self) -> Dict[str, Any]:
+        return self.health_report
+    
+    async def refresh_tools(self) -> List[types.Tool]:
+        """Fetch the tool catalog, from the daemon's cache unless it is a refetch"""
+        result = await self.daemon.request("list_tools", server=self.remote_name, refresh=self.tools is not None)
+        self.tools = [types.Tool.model_validate(tool) for tool in result["tools"]]
+        self.tools_stale = False
+        return self.tools
+
 class NapierClient:
     """
     Napier - An MCP client that connects AI models with third-party applications.
     Currently supports Gemini model integration.
     """
-    def __init__(self):
-        # Initialize session and client objects
-        self.session: Optional[ClientSession] = None
+    def __init__(self, backend: Optional[ModelBackend] = None):
+        # Load environment variables from .env file
+        from dotenv import load_dotenv
+        load_dotenv()
+        
+        # Connected MCP servers by name, and a router from each exposed
+        # (namespaced) tool name to its server and original tool name
+        self.servers: Dict[str, MCPServer] = {}
+        self.tool_routes: Dict[str, Tuple[MCPServer, str]] = {}
+        # Input schema of each exposed tool, by namespaced name
+        self.tool_schemas: Dict[str, Dict[str, Any]] = {}
         self.exit_stack = AsyncExitStack()
+        # Connection started in the background by connect_in_background()
+        self.connecting: Optional[asyncio.Task] = None
+        # Servers come from a running Napier daemon (NAPIER_SOCKET) when one
+        # is listening, unless NAPIER_DAEMON=off
+        self.daemon_socket = None if os.getenv("NAPIER_DAEMON", "auto").lower() == "off" else _default_socket_path()
+        self._daemon_attach: Optional[asyncio.Task] = None
+        
+        # Initialize Gemini API unless another model backend was supplied
+        if backend is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                console.print("[bold red]Error: GEMINI_API_KEY not found in environment variables.[/bold red]")
+                console.print("[yellow]Please create a .env file with your GEMINI_API_KEY=[/yellow]")
+                sys.exit(1)
+            backend = GeminiBackend(api_key)
+        self.backend = backend
+        
+        # All model requests share one scheduler: NAPIER_RPM / NAPIER_TPM
+        # limits (0 = unlimited), NAPIER_MAX_RETRIES retries of 429 and 5xx
+        # errors with backoff from NAPIER_BACKOFF_BASE up to NAPIER_BACKOFF_MAX
+        self.scheduler = RequestScheduler(
+            rpm=int(os.getenv("NAPIER_RPM", "0")),
+            tpm=int(os.getenv("NAPIER_TPM", "0")),
+            max_retries=int(os.getenv("NAPIER_MAX_RETRIES", "5")),
+            backoff_base=float(os.getenv("NAPIER_BACKOFF_BASE", "1.0")),
+            backoff_max=float(os.getenv("NAPIER_BACKOFF_MAX", "60"))
+        )
+        # Interactive turns are admitted ahead of background work (batch runs)
+        self.request_priority = RequestScheduler.INTERACTIVE
+        
+        # One long-lived chat session per conversation, shared by tool and
+        # direct chat turns and extended incrementally instead of replayed.
+        # Started on first use, so the prompt does not wait for the model SDK
+        self._chat = None
+        # System instruction (and catalog) the chat was started with, and
+        # whether that prefix is served from the context cache
+        self._chat_key: Optional[str] = None
+        self._chat_cached_content: Any = None
+        self.chat_cached = False
+        # Preamble the chat has already seen, so it is not resent every turn
+        self.chat_preamble: Optional[str] = None
+        
+        # Keep the history under NAPIER_HISTORY_TOKENS, with the last
+        # NAPIER_HISTORY_KEEP_TURNS turns verbatim and the rest summarized
+        self.history = HistoryManager(
+            self.backend,
+            token_budget=int(os.getenv("NAPIER_HISTORY_TOKENS", "16000")),
+            keep_turns=int(os.getenv("NAPIER_HISTORY_KEEP_TURNS", "6")),
+            scheduler=self.scheduler
+        )
+        
+        # Combined tool catalog of all servers, fetched once per connection and
+        # refreshed only when a server reports notifications/tools/list_changed
+        # or the user asks for it with '/tools refresh'
+        self.tool_cache: Optional[List[types.Tool]] = None
+        self.tool_catalog_hash = ""
+        
+        # With NAPIER_TOOL_TOP_K set, only the k tools most relevant to a query
+        # (BM25 over names, descriptions and parameters), plus the
+        # NAPIER_PINNED_TOOLS, are offered to the model; it is meant for large
+        # catalogs, so the default of 0 offers the whole catalog
+        self.tool_top_k = int(os.getenv("NAPIER_TOOL_TOP_K", "0"))
+        self.pinned_tools = {
+            name.strip() for name in os.getenv("NAPIER_PINNED_TOOLS", "").split(",") if name.strip()
+        }
+        self.tool_index: Optional[ToolIndex] = None
+        # Compact prompt-mode signatures by tool name, rebuilt with the catalog
+        self.tool_signatures: Dict[str, str] = {}
+        
+        # Results of read-only tools (readOnlyHint annotation, or listed in
+        # NAPIER_READONLY_TOOLS) are cached for NAPIER_TOOL_CACHE_TTL seconds,
+        # overridable per tool with NAPIER_TOOL_CACHE_TTLS="list_chats=10,..."
+        self.read_only_tools: set = set()
+        self.read_only_allowlist = {
+            name.strip() for name in os.getenv("NAPIER_READONLY_TOOLS", "").split(",") if name.strip()
+        }
+        self.tool_result_cache = ToolResultCache(
+            default_ttl=float(os.getenv("NAPIER_TOOL_CACHE_TTL", "30")),
+            ttls={
+                name.strip(): float(ttl)
+                for name, _, ttl in (item.partition("=") for item in os.getenv("NAPIER_TOOL_CACHE_TTLS", "").split(","))
+                if name.strip() and ttl.strip()
+            },
+            max_bytes=int(os.getenv("NAPIER_TOOL_CACHE_BYTES", str(8 * 1024 * 1024)))
+        )
+        self.tool_cache_hits = 0
+        self.tool_cache_fetches = 0
+        
+        # How tools are exposed to Gemini: "native" function calling or
+        # "prompt" (schemas in the prompt, calls parsed from ```json blocks)
+        self.tool_mode = os.getenv("NAPIER_TOOL_MODE", "native").lower()
+        
+        # Persistent cache of tool plans, so a repeated tool-routing query can
+        # skip the planning call (NAPIER_PLAN_CACHE=off disables it)
+        plan_cache_path = os.getenv("NAPIER_PLAN_CACHE", os.path.join(
+            os.path.expanduser("~"), ".cache", "napier", "plan_cache.sqlite3"
+        ))
+        self.plan_cache: Optional[PlanCache] = None
+        if plan_cache_path.lower() != "off":
+            try:
+                self.plan_cache = PlanCache(
+                    plan_cache_path,
+                    ttl=float(os.getenv("NAPIER_PLAN_CACHE_TTL", "86400")),
+                    max_entries=int(os.getenv("NAPIER_PLAN_CACHE_SIZE", "1000"))
+                )
+            except Exception as e:
+                # e.g. a read-only home directory, run without the cache
+                console.print(f"[yellow]Plan cache disabled: {str(e)}[/yellow]")
         
-        # Initialize Gemini API
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            console.print("[bold red]Error: GEMINI_API_KEY not found in environment variables.[/bold red]")
-            console.print("[yellow]Please create a .env file with your GEMINI_API_KEY=[/yellow]")
-            sys.exit(1)
+        # Tool results larger than NAPIER_RESULT_BUDGET bytes (per tool with
+        # NAPIER_RESULT_BUDGETS="list_messages=4000,...") are truncated before
+        # they reach the model (a budget of 0 turns this off); the most recent
+        # full results are kept so the model can page through them with the
+        # expand_result tool
+        self.result_budget = int(os.getenv("NAPIER_RESULT_BUDGET", "16000"))
+        self.result_budgets = {
+            name.strip(): int(budget)
+            for name, _, budget in (item.partition("=") for item in os.getenv("NAPIER_RESULT_BUDGETS", "").split(","))
+            if name.strip() and budget.strip()
+        }
+        self.full_results: OrderedDict[str, str] = OrderedDict()
+        self.full_results_limit = 20
+        self.result_counter = 0
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        # Results over NAPIER_DIGEST_THRESHOLD bytes (0 disables) are split into
+        # NAPIER_DIGEST_CHUNK byte chunks and digested by the model, with at most
+        # NAPIER_DIGEST_CONCURRENCY chunk calls in flight, instead of truncated
+        self.digest_threshold = int(os.getenv("NAPIER_DIGEST_THRESHOLD", "0"))
+        self.digest_chunk_bytes = int(os.getenv("NAPIER_DIGEST_CHUNK", "16000"))
+        self.digest_concurrency = max(int(os.getenv("NAPIER_DIGEST_CONCURRENCY", "4")), 1)
         
-        # Conversation history
-        self.chat_history = []
-        self.connected_server = None
+        # Maximum number of tool calls executed concurrently per turn
+        self.tool_concurrency = max(int(os.getenv("NAPIER_TOOL_CONCURRENCY", "4")), 1)
+        
+        # A turn runs tool rounds until the model answers or one of its
+        # budgets runs out: NAPIER_MAX_TOOL_STEPS rounds, NAPIER_TURN_TIME_BUDGET
+        # seconds or NAPIER_TURN_TOKEN_BUDGET model tokens (0 = unlimited)
+        self.max_tool_steps = max(int(os.getenv("NAPIER_MAX_TOOL_STEPS", "5")), 1)
+        self.turn_time_budget = float(os.getenv("NAPIER_TURN_TIME_BUDGET", "120"))
+        self.turn_token_budget = int(os.getenv("NAPIER_TURN_TOKEN_BUDGET", "0"))
+        self.last_turn_timings: Dict[str, Any] = {}
+        self.last_turn_tool_calls: List[Dict[str, Any]] = []
+        self.last_turn_usage: Dict[str, int] = {}
+        self.last_turn_model_calls: List[Dict[str, Any]] = []
+        self.turn_start = time.perf_counter()
+        # Breakdown of every finished turn, shared with forked conversations
+        self.turn_records: List[Dict[str, Any]] = []
+        self.turn_query = ""
+        # Chat history at the start of the turn, restored when the turn fails
+        self.turn_history: Optional[List[Any]] = None
+        
+        # Stream model output into a live view, re-rendered at most
+        # NAPIER_STREAM_FPS times per second
+        self.streaming = os.getenv("NAPIER_STREAM", "0").lower() in ("1", "true", "yes", "on")
+        self.stream_render_interval = 1.0 / max(float(os.getenv("NAPIER_STREAM_FPS", "8")), 1.0)
+        
+        # Heartbeat, tool call timeout and restart backoff of spawned servers
+        self.server_options = _server_options_from_env()
+        
+        # Chrome trace-event spans, written to NAPIER_TRACE (or --trace) on cleanup
+        self.tracer = Tracer(os.getenv("NAPIER_TRACE") or None)
+        
+        # With NAPIER_CONTEXT_CACHE=on the system instruction and the full tool
+        # catalog are registered with Gemini's context cache for
+        # NAPIER_CONTEXT_CACHE_TTL seconds; tool filtering is skipped then,
+        # since the cached catalog is cheaper than a changing prefix
+        self.context_cache: Optional[ContextCache] = None
+        if (os.getenv("NAPIER_CONTEXT_CACHE", "off").lower() in ("1", "true", "yes", "on")
+                and isinstance(self.backend, GeminiBackend)):
+            self.context_cache = GeminiContextCache(
+                self.backend, ttl=float(os.getenv("NAPIER_CONTEXT_CACHE_TTL", "3600"))
+            )
         
         # System prompt for Gemini
         self.system_prompt = """You are a helpful AI assistant in the Napier terminal application.
@@ -59,191 +1764,915 @@ Be concise, helpful, and friendly in your responses."""
         Args:
             server_script_path: Path to the server script (.py or .js)
         """
-        # Store the server path
-        self.connected_server = server_script_path
-        
-        is_python = server_script_path.endswith('.py')
-        is_js = server_script_path.endswith('.js')
-        if not (is_python or is_js):
-            raise ValueError("Server script must be a .py or .js file")
+        with self.tracer.span("connect_to_server", server=server_script_path) as span:
+            try:
+                console.print(f"[yellow]Connecting to MCP server: {server_script_path}...[/yellow]")
+                daemon = await self._attach_daemon()
+                if daemon:
+                    # The daemon returns the tool list along with the server
+                    server = await daemon.connect(server_script_path)
+                else:
+                    server = MCPServer(server_script_path, **self.server_options)
+                    await server.start()
+                    self.exit_stack.push_async_callback(server.close)
+                    
+                    # List available tools before the server becomes routable
+                    await server.refresh_tools()
+                self.tool_cache_fetches += 1
+                
+                # Register under a unique name used to namespace its tools
+                server.name = _server_name(server.name, self.servers)
+                self.servers[server.name] = server
 
-        command = "python" if is_python else "node"
-        server_params = StdioServerParameters(
-            command=command,          # Python or Node interpreter
-            args=[server_script_path], # Path to server script
-            env=None                  # Use current environment
-        )
+                # Rebuild the combined catalog cache
+                self.tool_cache = None
+                await self.get_tools()
+                tool_names = [name for name, (owner, _) in self.tool_routes.items() if owner is server]
+                
+                console.print(f"[green]Successfully connected to server '{server.name}'![/green]")
+                console.print(Panel(
+                    f"[bold]Available tools:[/bold]\n" + "\n".join([f"• {name}" for name in tool_names]),
+                    title="MCP Server Connection",
+                    border_style="green"
+                ))
+                
+                span.set(tools=len(tool_names))
+                return tool_names
+            except Exception as e:
+                console.print(f"[bold red]Error connecting to server: {str(e)}[/bold red]")
+                return None
+    
+    async def connect_to_servers(self, server_script_paths: List[str]):
+        """Connect to several MCP servers in parallel
 
-        try:
-            console.print(f"[yellow]Connecting to MCP server: {server_script_path}...[/yellow]")
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-            self.stdio, self.write = stdio_transport
-            self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-
-            # Initialize the session
-            await self.session.initialize()
-
-            # List available tools
-            response = await self.session.list_tools()
-            tools = response.tools
-            tool_names = [tool.name for tool in tools]
-            
-            console.print(f"[green]Successfully connected to server![/green]")
-            console.print(Panel(
-                f"[bold]Available tools:[/bold]\n" + "\n".join([f"• {name}" for name in tool_names]),
-                title="MCP Server Connection",
-                border_style="green"
-            ))
-            
-            return tool_names
-        except Exception as e:
-            console.print(f"[bold red]Error connecting to server: {str(e)}[/bold red]")
+        Servers are spawned and initialized concurrently, so startup takes
+        about as long as the slowest server rather than the sum of all.
+
+        Args:
+            server_script_paths: Paths to the server scripts (.py or .js)
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.connect_to_server(path) for path in server_script_paths))
+        console.print(f"[dim]Connected {sum(r is not None for r in results)}/{len(results)} "
+                      f"server(s) in {time.perf_counter() - start:.2f}s[/dim]")
+        return results
+    
+    async def _attach_daemon(self) -> Optional[DaemonClient]:
+        """The connection to a running Napier daemon, attached on first use"""
+        if not self.daemon_socket:
             return None
+        
+        async def attach() -> Optional[DaemonClient]:
+            daemon = await DaemonClient.attach(self.daemon_socket)
+            if daemon:
+                self.exit_stack.push_async_callback(daemon.close)
+                console.print(f"[dim]Using MCP servers from the Napier daemon at {self.daemon_socket}[/dim]")
+            return daemon
+        
+        # Servers connecting in parallel share one attach attempt
+        if self._daemon_attach is None:
+            self._daemon_attach = asyncio.create_task(attach())
+        return await self._daemon_attach
+    
+    def connect_in_background(self, server_script_paths: List[str]) -> None:
+        """Start connecting to servers without waiting for them
+        
+        Server spawn, initialize and list_tools then overlap with the banner
+        and the user typing. Anything that needs tools awaits wait_for_servers().
+        """
+        self.connecting = asyncio.create_task(self.connect_to_servers(server_script_paths))
+    
+    async def wait_for_servers(self) -> None:
+        """Wait for a background connection to finish, if one is running"""
+        if self.connecting is None:
+            return
+        if not self.connecting.done():
+            console.print("[dim]Waiting for MCP servers to finish connecting...[/dim]")
+        await self.connecting
+    
+    async def get_tools(self, refresh: bool = False) -> List[types.Tool]:
+        """Return the combined tool catalog, served from cache when possible
+
+        Tool names are namespaced as '<server>__<tool>' and routed back to
+        their server through self.tool_routes.
+
+        Args:
+            refresh: Force a list_tools round trip even if the cache is fresh
+        """
+        servers = list(self.servers.values())
+        stale = [server for server in servers if refresh or server.tools is None or server.tools_stale]
+        if self.tool_cache is not None and not stale:
+            self.tool_cache_hits += 1
+            return self.tool_cache
+        
+        await asyncio.gather(*(server.refresh_tools() for server in stale))
+        self.tool_cache_fetches += len(stale)
+        
+        self.tool_cache = []
+        self.tool_routes = {}
+        self.tool_schemas = {}
+        self.read_only_tools = set()
+        for server in servers:
+            for tool in server.tools:
+                name = f"{server.name}__{tool.name}"
+                self.tool_cache.append(tool.model_copy(update={"name": name}))
+                self.tool_routes[name] = (server, tool.name)
+                self.tool_schemas[name] = tool.inputSchema
+                if ((tool.annotations and tool.annotations.readOnlyHint)
+                        or name in self.read_only_allowlist or tool.name in self.read_only_allowlist):
+                    self.read_only_tools.add(name)
+        # Sorted, so the tools part of the prompt prefix is byte-stable
+        self.tool_cache.sort(key=lambda tool: tool.name)
+        self.tool_catalog_hash = hashlib.sha256(json.dumps(
+            [tool.model_dump(mode="json") for tool in self.tool_cache], sort_keys=True
+        ).encode()).hexdigest()
+        self.tool_index = ToolIndex(self.tool_cache) if self.tool_top_k else None
+        self.tool_signatures = {}
+        return self.tool_cache
+    
+    def _select_tools(self, query: str, tools: List[types.Tool]) -> List[types.Tool]:
+        """Narrow the catalog to the tools relevant to a query, plus pinned ones
+        
+        Falls back to the whole catalog when no tool matches the query (e.g. a
+        follow-up that only makes sense with the history).
+        """
+        if not self.tool_index or len(tools) <= self.tool_top_k:
+            return tools
+        
+        selected = set(self.tool_index.top(query, self.tool_top_k))
+        if not selected:
+            console.print("[dim]No tool matches the query, offering the whole catalog[/dim]")
+            return tools
+        selected.update(
+            tool.name for tool in tools
+            if tool.name in self.pinned_tools or self.tool_routes[tool.name][1] in self.pinned_tools
+        )
+        filtered = [tool for tool in tools if tool.name in selected]
+        
+        before = _tool_prompt_size(tools) // HistoryManager.CHARS_PER_TOKEN
+        after = _tool_prompt_size(filtered) // HistoryManager.CHARS_PER_TOKEN
+        self.last_turn_timings["tool_prompt_tokens_before"] = before
+        self.last_turn_timings["tool_prompt_tokens_after"] = after
+        console.print(f"[dim]Offering {len(filtered)} of {len(tools)} tools "
+                      f"(~{before} -> ~{after} prompt tokens)[/dim]")
+        return filtered
     
     async def process_query(self, query: str) -> str:
         """Process a query using Gemini and available tools"""
-        if not self.session:
+        await self.wait_for_servers()
+        if not self.servers:
             return "Error: Not connected to any MCP server. Use 'connect' command first."
         
-        # Add user query to history
-        self.chat_history.append({"role": "user", "parts": [query]})
+        with self.tracer.span("process_query", request_bytes=len(query.encode())) as span:
+            try:
+                await self._begin_turn(query)
+                response_text = await self._process_query(query)
+                span.set(response_bytes=len(response_text.encode()))
+                return response_text
+            except Exception as e:
+                self._rewind_turn()
+                console.print(f"[bold red]Error: {str(e)}[/bold red]")
+                return f"Error processing query: {str(e)}"
+            finally:
+                self._end_turn()
+    
+    async def _round_tools(self, query: str, previous: Optional[List[types.Tool]] = None) -> List[types.Tool]:
+        """Tools to offer in a round of the turn
+
+        The selection is recomputed every round, from the query and the
+        results so far, on top of the tools already offered, so a tool a
+        result leads to (e.g. messages of a contact just found) can join.
+        napier__expand_result is added once a result has been truncated.
+        """
+        tools = await self.get_tools()
+        if not self.chat_cached:
+            selected = self._select_tools(query, tools)
+            if previous and selected is not tools:
+                names = {tool.name for tool in selected} | {tool.name for tool in previous}
+                selected = [tool for tool in tools if tool.name in names]
+            tools = selected
+        if self.full_results:
+            tools = tools + [self._expand_result_tool()]
+        return tools
+    
+    async def _process_query(self, query: str) -> str:
+        # Get available tools from the catalog cache
+        start = time.perf_counter()
+        tools = await self._round_tools(query)
+        self.last_turn_timings["catalog_fetch"] = time.perf_counter() - start
         
-        # Get available tools from the server
-        response = await self.session.list_tools()
-        available_tools = [{
-            "name": tool.name,
-            "description": tool.description,
-            "input_schema": tool.inputSchema
-        } for tool in response.tools]
+        if self.tool_mode == "native":
+            return await self._process_query_native(query, tools)
         
-        # Format tools for Gemini
-        tools_description = "You have access to the following tools:\n\n"
-        for tool in available_tools:
-            tools_description += f"- {tool['name']}: {tool['description']}\n"
-            tools_description += f"  Input schema: {json.dumps(tool['input_schema'], indent=2)}\n\n"
+        start = time.perf_counter()
+        
+        # The instructions are in the system instruction; the tool list goes
+        # with the query, unless the full catalog is part of the cached prefix
+        if self.chat_cached:
+            content = [query]
+        else:
+            content = self._with_preamble(self._tools_description(tools), query)
+        self.last_turn_timings["prompt_assembly"] = time.perf_counter() - start
         
-        # Prepare prompt with instructions and tools
-        system_prompt = f"""You are an AI assistant that helps users interact with various applications through tools.
-{tools_description}
-
-INSTRUCTIONS:
-1. Analyze the user's request carefully.
-2. If a tool is needed to fulfill the request, decide which tool to use.
-3. Format your tool calls as JSON, wrapped in triple backticks with the 'json' tag.
-4. Example tool call format:
-```json
-{{
-  "tool_name": "tool_name_here",
-  "parameters": {{
-    "param1": "value1",
-    "param2": "value2"
-  }}
-}}
-```
-5. After receiving tool results, provide a helpful response that incorporates the information.
-6. If no tool is needed, respond directly to the user's request.
-
-Always make sure to follow the exact input schema for each tool when making a call."""
-
         try:
-            # Initialize Gemini chat
-            chat = self.model.start_chat(history=self.chat_history)
+            chat = self.chat
             
-            # Send the query along with system prompt
-            response = chat.send_message(
-                [system_prompt, query],
+            # Send the query along with the tool list
+            response = await self._send_message(
+                chat,
+                content,
                 generation_config={"temperature": 0.2}
             )
             
             response_text = response.text
-            self.chat_history.append({"role": "model", "parts": [response_text]})
             
             # Process tool calls in response
-            import re
-            tool_call_pattern = r"```json\s*(\{[^`]*\})\s*```"
-            tool_calls = re.findall(tool_call_pattern, response_text)
+            parsed_calls, invalid = _parse_prompt_tool_calls(response_text)
+            if not parsed_calls and not invalid:
+                # No tool calls, just return the response
+                return response_text
             
             final_response = []
+            for _ in range(invalid):
+                console.print(f"[bold red]Error: Invalid JSON format in tool call[/bold red]")
+                final_response.append("Error: Invalid tool call format detected.")
             
-            if tool_calls:
-                for tool_call_json in tool_calls:
-                    try:
-                        tool_call = json.loads(tool_call_json)
-                        tool_name = tool_call.get("tool_name")
-                        parameters = tool_call.get("parameters", {})
-                        
-                        console.print(f"[bold cyan]Executing tool:[/bold cyan] {tool_name}")
-                        console.print(f"[cyan]Parameters:[/cyan] {json.dumps(parameters, indent=2)}")
-                        
-                        # Execute tool call
-                        result = await self.session.call_tool(tool_name, parameters)
-                        
-                        # Format tool result for display
-                        result_str = f"\n[Tool Result: {tool_name}]\n{result.content}\n"
-                        final_response.append(result_str)
-                        
-                        # Send tool result back to Gemini
-                        followup_system_prompt = f"""The tool '{tool_name}' returned the following result:
-
-{result.content}
-
-Please analyze this result and provide a helpful response to the user based on this information."""
-
-                        followup_response = chat.send_message(followup_system_prompt)
-                        final_response.append(followup_response.text)
-                        self.chat_history.append({"role": "model", "parts": [followup_response.text]})
-                        
-                    except json.JSONDecodeError:
-                        console.print(f"[bold red]Error: Invalid JSON format in tool call[/bold red]")
-                        final_response.append("Error: Invalid tool call format detected.")
-                    except Exception as e:
-                        console.print(f"[bold red]Error executing tool: {str(e)}[/bold red]")
-                        final_response.append(f"Error executing tool: {str(e)}")
-                
+            if not parsed_calls:
                 return "\n".join(final_response)
-            else:
-                # No tool calls, just return the response
-                return response_text
+            
+            step = 1
+            while True:
+                # Execute all ready tool calls of this round concurrently
+                results = await self._execute_tool_calls(parsed_calls)
+                
+                results_text = ""
+                for call in results:
+                    # Format tool result for display
+                    final_response.append(f"\n[Tool Result: {call['tool_name']}]\n{call['result']}\n")
+                    results_text += f"The tool '{call['tool_name']}' returned the following result:\n\n{call['result']}\n\n"
+                
+                # Send all tool results back to Gemini in a single follow-up turn,
+                # allowing another round of calls while the budget lasts
+                stop_reason = self._tool_budget_exhausted(step)
+                if stop_reason:
+                    console.print(f"[dim]Stopping after {step} tool round(s): {stop_reason}[/dim]")
+                    followup_system_prompt = f"""{results_text}Please analyze these results and provide a helpful response to the user based on this information. Do not call any more tools."""
+                else:
+                    followup_system_prompt = f"""{results_text}If you need more information that depends on these results, make the next tool calls. Otherwise, please analyze these results and provide a helpful response to the user based on this information."""
+                
+                tools = await self._round_tools(f"{query}\n{results_text}", tools)
+                if not self.chat_cached:
+                    followup_content = self._with_preamble(self._tools_description(tools), followup_system_prompt)
+                else:
+                    followup_content = followup_system_prompt
+                followup_response = await self._send_message(chat, followup_content)
+                followup_text = followup_response.text
+                
+                parsed_calls = []
+                if not stop_reason:
+                    parsed_calls, _ = _parse_prompt_tool_calls(followup_text)
+                if not parsed_calls:
+                    break
+                step += 1
+            
+            self.last_turn_timings["tool_rounds"] = step
+            final_response.append(followup_text)
+            return "\n".join(final_response)
                 
         except Exception as e:
+            self._rewind_turn()
             console.print(f"[bold red]Error: {str(e)}[/bold red]")
             return f"Error processing query: {str(e)}"
 
-    async def chat_with_gemini(self, query: str) -> str:
-        """Chat directly with Gemini without using MCP tools"""
-        # Add user query to history
-        self.chat_history.append({"role": "user", "parts": [query]})
-        
+    async def _process_query_native(self, query: str, tools: List[types.Tool]) -> str:
+        """Process a query using Gemini's native function calling
+
+        Tool input schemas are passed as function declarations, so calls come
+        back as structured function_call parts instead of JSON in the text.
+        """
+        function_declarations = None
+
         try:
-            # Initialize Gemini chat with system prompt
-            chat = self.model.start_chat(history=self.chat_history)
+            chat = self.chat
             
-            # Send the query with system prompt
-            response = chat.send_message(
-                [self.system_prompt, query],
-                generation_config={"temperature": 0.7}
-            )
+            plan_key = None
+            plan = None
+            if self.plan_cache:
+                plan_key = PlanCache.make_key(self.tool_catalog_hash, query, self._history_fingerprint())
+                plan = self.plan_cache.get(plan_key)
             
-            response_text = response.text
-            self.chat_history.append({"role": "model", "parts": [response_text]})
+            if plan is not None:
+                # Replay the cached plan into the chat as if the model had sent it
+                chat.history = list(chat.history) + [
+                    {"role": "user", "parts": [query]},
+                    {"role": "model", "parts": [genai.protos.Part(
+                        function_call=genai.protos.FunctionCall(name=call["tool_name"], args=call["parameters"])
+                    ) for call in plan]}
+                ]
+                self.last_turn_timings["plan_cache_hit"] = True
+            else:
+                start = time.perf_counter()
+                if not self.chat_cached:
+                    function_declarations = self._function_declarations(tools)
+                self.last_turn_timings["prompt_assembly"] = time.perf_counter() - start
+                
+                # Send the query along with the function declarations, which
+                # a cached prefix already holds
+                response = await self._send_message(
+                    chat,
+                    [query],
+                    generation_config={"temperature": 0.2},
+                    **self._tool_kwargs(function_declarations)
+                )
+                
+                plan = [{
+                    "tool_name": part.function_call.name,
+                    "parameters": genai.protos.FunctionCall.to_dict(part.function_call).get("args", {})
+                } for part in response.parts if part.function_call.name]
+                
+                if not plan:
+                    # No tool calls, just return the response
+                    return _response_text(response)
+                
+                # Only plans of read-only calls are safe to replay; this also
+                # leaves out result ids, which are only valid in this session
+                if self.plan_cache and all(call["tool_name"] in self.read_only_tools for call in plan):
+                    self.plan_cache.put(plan_key, plan)
+            
+            final_response = []
+            step = 1
+            while True:
+                # Execute all ready tool calls of this round concurrently
+                results = await self._execute_tool_calls(plan)
+                
+                function_responses = []
+                for call in results:
+                    final_response.append(f"\n[Tool Result: {call['tool_name']}]\n{call['result']}\n")
+                    function_responses.append(genai.protos.Part(
+                        function_response=genai.protos.FunctionResponse(
+                            name=call["tool_name"],
+                            response={"result": call["result"]}
+                        )
+                    ))
+                
+                # Send the results back as function responses; while the budget
+                # lasts the model may answer with another round of calls
+                stop_reason = self._tool_budget_exhausted(step)
+                if stop_reason:
+                    console.print(f"[dim]Stopping after {step} tool round(s): {stop_reason}[/dim]")
+                    # Cached declarations cannot be left out (nor tool_config
+                    # set next to cached content), so ask for the answer instead
+                    if self.chat_cached:
+                        function_responses.append(genai.protos.Part(
+                            text="Answer the user with these results. Do not call any more tools."
+                        ))
+                    followup_response = await self._send_message(chat, function_responses)
+                    plan = []
+                else:
+                    results_text = "\n".join(str(call["result"]) for call in results)
+                    round_tools = await self._round_tools(f"{query}\n{results_text}", tools)
+                    if [tool.name for tool in round_tools] != [tool.name for tool in tools]:
+                        tools = round_tools
+                        function_declarations = None
+                    if function_declarations is None and not self.chat_cached:
+                        function_declarations = self._function_declarations(tools)
+                    followup_response = await self._send_message(
+                        chat, function_responses,
+                        generation_config={"temperature": 0.2},
+                        **self._tool_kwargs(function_declarations)
+                    )
+                    plan = [{
+                        "tool_name": part.function_call.name,
+                        "parameters": genai.protos.FunctionCall.to_dict(part.function_call).get("args", {})
+                    } for part in followup_response.parts if part.function_call.name]
+                
+                if not plan:
+                    break
+                step += 1
             
-            return response_text
+            self.last_turn_timings["tool_rounds"] = step
+            final_response.append(_response_text(followup_response))
+            return "\n".join(final_response)
                 
         except Exception as e:
+            self._rewind_turn()
             console.print(f"[bold red]Error: {str(e)}[/bold red]")
-            return f"Error: {str(e)}"
+            return f"Error processing query: {str(e)}"
+    
+    def _tool_budget_exhausted(self, step: int) -> Optional[str]:
+        """Why the turn may not start another tool round, or None if it may"""
+        if step >= self.max_tool_steps:
+            return f"step budget of {self.max_tool_steps} reached"
+        if time.perf_counter() - self.turn_start >= self.turn_time_budget:
+            return f"time budget of {self.turn_time_budget:.0f}s reached"
+        if self.turn_token_budget and self.last_turn_usage.get("total_token_count", 0) >= self.turn_token_budget:
+            return f"token budget of {self.turn_token_budget} reached"
+        return None
+    
+    @property
+    def chat(self):
+        """The conversation's chat session, started on first use"""
+        if self._chat is None:
+            self._chat = self.backend.start_chat([], system_instruction=self._system_instruction())
+            # Not started from the current prefix key, so the next turn re-syncs
+            self._chat_key = None
+        return self._chat
+    
+    def _system_instruction(self) -> str:
+        """The stable preamble for the current tool mode and servers"""
+        if not self.servers:
+            return self.system_prompt
+        if self.tool_mode == "native":
+            return f"{self.system_prompt}\n\n{NATIVE_TOOL_INSTRUCTIONS}"
+        return f"{self.system_prompt}\n\n{PROMPT_TOOL_INSTRUCTIONS}"
+    
+    async def _sync_chat(self) -> None:
+        """Restart the chat, keeping its history, when its prefix has changed
+        
+        The prefix is the system instruction plus, with the context cache, the
+        tool catalog including napier__expand_result. With the context cache
+        the chat is started from the cached prefix of the current catalog,
+        registering it on first use and again once the cache entry has
+        expired; if the provider refuses it, the chat runs on the plain
+        instruction and tools are sent per request.
+        """
+        instruction = self._system_instruction()
+        cached_instruction = instruction
+        cached_tools = None
+        catalog_hash = ""
+        if self.servers and self.context_cache:
+            # The cached prefix holds the catalog, so it has to be current
+            catalog = await self.get_tools() + [self._expand_result_tool()]
+            catalog_hash = self.tool_catalog_hash
+            if self.tool_mode == "native":
+                cached_tools = [self._function_declarations(catalog)]
+            else:
+                cached_instruction = f"{instruction}\n\n{self._tools_description(catalog)}"
+        key = hashlib.sha256(f"{cached_instruction}\0{catalog_hash}".encode()).hexdigest()
+        current = self._chat is not None and key == self._chat_key
+        if current and not self.chat_cached:
+            return
+        
+        cached_content = None
+        if self.context_cache:
+            cached_content = await self.context_cache.get(key, cached_instruction, cached_tools)
+            # Still served from the same, unexpired cache entry
+            if current and cached_content is self._chat_cached_content:
+                return
+        
+        history = list(self._chat.history) if self._chat is not None else []
+        self._chat = self.backend.start_chat(
+            history,
+            system_instruction=None if cached_content is not None else instruction,
+            cached_content=cached_content
+        )
+        self._chat_key = key
+        self._chat_cached_content = cached_content
+        self.chat_cached = cached_content is not None
+    
+    def _tool_kwargs(self, function_declarations) -> Dict[str, Any]:
+        """Tools argument of a model call, none when the cached prefix holds them"""
+        return {} if self.chat_cached else {"tools": [function_declarations]}
+    
+    def _tools_description(self, tools: List[types.Tool]) -> str:
+        """Prompt-mode tool list as compact signatures, each rendered once per catalog"""
+        tools_description = "You have access to the following tools:\n\n"
+        for tool in tools:
+            signature = self.tool_signatures.get(tool.name)
+            if signature is None:
+                signature = self.tool_signatures[tool.name] = _tool_signature(tool)
+            tools_description += f"- {signature}\n"
+        tools_description += "\nParameters marked ? are optional, '= value' shows an optional parameter's default.\n"
+        return tools_description
+    
+    @property
+    def chat_history(self) -> List[Any]:
+        """Conversation history, as held by the shared chat session"""
+        return self.chat.history
+    
+    def _history_fingerprint(self, entries: int = 2) -> str:
+        """Hash of the last few history entries, used to scope cached plans"""
+        recent = "\0".join(_content_text(content) for content in self.chat_history[-entries:])
+        return hashlib.sha256(recent.encode()).hexdigest()
+    
+    def _with_preamble(self, preamble: str, query: str) -> List[str]:
+        """Build message content, prefixing the preamble only when it changed
+
+        The chat session keeps every message in its history, so a preamble
+        that was already sent is still in context and is not repeated.
+        """
+        if preamble == self.chat_preamble:
+            return [query]
+        self.chat_preamble = preamble
+        return [preamble, query]
+    
+    async def _begin_turn(self, query: str) -> None:
+        """Reset the per-turn timing breakdown and compact the history"""
+        self.turn_start = time.perf_counter()
+        self.turn_query = query
+        self.last_turn_timings = {}
+        self.last_turn_tool_calls = []
+        self.last_turn_usage = {}
+        self.last_turn_model_calls = []
+        self.turn_history = None
+        
+        await self._sync_chat()
+        if await self.history.compact(
+                self.chat, lambda response, elapsed: self._record_usage(response, elapsed, "compaction")):
+            # The preamble may have been folded into the summary
+            self.chat_preamble = None
+            self.last_turn_timings["history_compaction"] = time.perf_counter() - self.turn_start
+        self.turn_history = list(self.chat.history)
+    
+    def _rewind_turn(self) -> None:
+        """Drop a failed turn's messages so the chat stays usable
+
+        A failed send can leave the chat with a broken streamed response or
+        an unanswered function call; either would break every later turn.
+        """
+        if self._chat is not None and self.turn_history is not None:
+            self._chat.history = self.turn_history
+        # The preamble may have gone with the dropped messages
+        self.chat_preamble = None
+    
+    def _mark_text_received(self) -> None:
+        """Record time to first and last token for the current turn"""
+        elapsed = time.perf_counter() - self.turn_start
+        self.last_turn_timings.setdefault("time_to_first_token", elapsed)
+        self.last_turn_timings["time_to_last_token"] = elapsed
+    
+    def _end_turn(self) -> None:
+        """Finish the turn's breakdown and add it to the session statistics"""
+        if self._chat is not None:
+            try:
+                self._chat.history
+            except Exception:
+                # A stream that ended on a safety or recitation stop answers
+                # the turn but leaves a history the SDK refuses to build
+                self._rewind_turn()
+        timings = self.last_turn_timings
+        timings["total"] = time.perf_counter() - self.turn_start
+        timings["model_time"] = sum(call["elapsed"] for call in self.last_turn_model_calls)
+        self.turn_records.append({
+            "timings": timings,
+            "usage": self.last_turn_usage,
+            "model_calls": self.last_turn_model_calls,
+            "tool_calls": self.last_turn_tool_calls
+        })
+    
+    def _record_usage(self, response, elapsed: float, purpose: str) -> None:
+        """Record a model call and add its token usage to the current turn's totals"""
+        usage = getattr(response, "usage_metadata", None)
+        call = {"purpose": purpose, "elapsed": elapsed}
+        for key in ("prompt_token_count", "candidates_token_count", "total_token_count"):
+            count = getattr(usage, key, 0) if usage else 0
+            call[key] = count
+            self.last_turn_usage[key] = self.last_turn_usage.get(key, 0) + count
+        self.last_turn_model_calls.append(call)
+        self.scheduler.charge(call["candidates_token_count"])
+    
+    async def _send_message(self, chat, content, **kwargs):
+        """Send a message to the model, streaming text into a live view when enabled"""
+        with self.tracer.span("send_message") as span:
+            response = await self._send_message_traced(chat, content, **kwargs)
+            if self.tracer.enabled:
+                span.set(request_bytes=len(str(content).encode()),
+                         response_bytes=len(_response_text(response).encode()),
+                         **self.last_turn_model_calls[-1])
+            return response
+    
+    async def _send_message_traced(self, chat, content, **kwargs):
+        start = time.perf_counter()
+        if not self.streaming:
+            response = await self._model_request(chat, content, **kwargs)
+            if _response_text(response):
+                self._mark_text_received()
+            self._record_usage(response, time.perf_counter() - start, "chat")
+            return response
+        
+        from rich.live import Live
+        from rich.markdown import Markdown
+        
+        response = await self._model_request(chat, content, stream=True, **kwargs)
+        text = ""
+        last_render = 0.0
+        with Live(console=console, transient=True, auto_refresh=False) as live:
+            async for chunk in response:
+                chunk_text = _response_text(chunk)
+                if not chunk_text:
+                    continue
+                self._mark_text_received()
+                text += chunk_text
+                
+                # Throttle Markdown re-rendering, it reparses the whole text
+                now = time.perf_counter()
+                if now - last_render >= self.stream_render_interval:
+                    live.update(Panel(Markdown(text), title="AI Response", border_style="cyan"), refresh=True)
+                    last_render = now
+        self._record_usage(response, time.perf_counter() - start, "chat")
+        return response
+    
+    async def _model_request(self, chat, content, **kwargs):
+        """Send a model request through the shared scheduler"""
+        tokens = 0
+        if self.scheduler.tpm:
+            tokens = (self.history.estimate_tokens(chat.history)
+                      + len(str(content)) // HistoryManager.CHARS_PER_TOKEN)
+        return await self.scheduler.submit(
+            lambda: self.backend.send_message(chat, content, **kwargs),
+            tokens=tokens,
+            priority=self.request_priority
+        )
+    
+    async def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Execute independent tool calls concurrently
+
+        At most self.tool_concurrency calls are in flight at once. Results come
+        back in request order with the flattened result text and the time each
+        call took; errors are reported in the result instead of raised.
+
+        Args:
+            tool_calls: Dicts with 'tool_name' and 'parameters'
+        """
+        semaphore = asyncio.Semaphore(self.tool_concurrency)
+        
+        async def execute(call: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                console.print(f"[bold cyan]Executing tool:[/bold cyan] {call['tool_name']}")
+                console.print(f"[cyan]Parameters:[/cyan] {json.dumps(call['parameters'], indent=2)}")
+                
+                start = time.perf_counter()
+                cached = False
+                try:
+                    result_text, cached = await self._call_tool(call["tool_name"], call["parameters"])
+                    result_text = await self._shape_tool_result(call["tool_name"], result_text)
+                except Exception as e:
+                    console.print(f"[bold red]Error executing tool: {str(e)}[/bold red]")
+                    result_text = f"Error executing tool: {str(e)}"
+                return {**call, "result": result_text, "cached": cached, "elapsed": time.perf_counter() - start}
+        
+        start = time.perf_counter()
+        results = await asyncio.gather(*(execute(call) for call in tool_calls))
+        wall_time = time.perf_counter() - start
+        self.last_turn_tool_calls.extend({
+            "tool_name": call["tool_name"],
+            "parameters": call["parameters"],
+            "cached": call["cached"],
+            "elapsed": call["elapsed"],
+            "result_bytes": len(call["result"].encode())
+        } for call in results)
+        
+        # Sequential execution would have cost the sum of the individual calls,
+        # totals add up over the tool rounds of a turn
+        sequential_time = sum(call["elapsed"] for call in results)
+        time_saved = max(sequential_time - wall_time, 0.0)
+        for key, value in (("tool_calls", len(results)), ("tool_wall_time", wall_time),
+                           ("tool_sequential_time", sequential_time), ("tool_time_saved", time_saved)):
+            self.last_turn_timings[key] = self.last_turn_timings.get(key, 0) + value
+        console.print(
+            f"[dim]{len(results)} tool call(s) in {wall_time:.2f}s "
+            f"(sequential {sequential_time:.2f}s, saved {time_saved:.2f}s)[/dim]"
+        )
+        return results
+    
+    def _result_budget(self, name: str) -> int:
+        """Byte budget for a tool's result, looked up by namespaced then bare name"""
+        bare_name = self.tool_routes[name][1] if name in self.tool_routes else name
+        return self.result_budgets.get(name, self.result_budgets.get(bare_name, self.result_budget))
+    
+    async def _shape_tool_result(self, name: str, result_text: str) -> str:
+        """Fit an oversized result into its budget, keeping the full text for expand_result
+
+        Results over the digest threshold are digested by the model when digest
+        mode is on; everything else is structurally truncated.
+        """
+        if name == EXPAND_RESULT_TOOL:
+            return result_text
+        budget = self._result_budget(name)
+        size = len(result_text.encode())
+        if budget <= 0 or size <= budget:
+            return result_text
+        
+        self.result_counter += 1
+        result_id = f"r{self.result_counter}"
+        self.full_results[result_id] = result_text
+        while len(self.full_results) > self.full_results_limit:
+            self.full_results.popitem(last=False)
+        
+        if self.digest_threshold and size > self.digest_threshold:
+            digest = await self._digest_result(name, result_text, budget)
+            if digest is not None:
+                return (f"[Digest of a {size} byte result]\n{digest}\n[Call {EXPAND_RESULT_TOOL} "
+                        f"with result_id \"{result_id}\" to read the full result.]")
+        
+        shaped = _shape_result(result_text, budget)
+        self.last_turn_timings["result_bytes_saved"] = (
+            self.last_turn_timings.get("result_bytes_saved", 0) + size - len(shaped.encode())
+        )
+        return (f"{shaped}\n[Result truncated from {size} bytes. Call {EXPAND_RESULT_TOOL} "
+                f"with result_id \"{result_id}\" to read the full result.]")
+    
+    async def _digest_result(self, name: str, result_text: str, budget: int) -> Optional[str]:
+        """Map-reduce a huge tool result into a digest relevant to the current query
+
+        Chunks are digested by concurrent model calls (map); if the joined
+        digests still exceed the budget they are merged by one more call
+        (reduce). Returns None if digestion failed.
+        """
+        items, _ = _split_result_items(result_text)
+        chunks = []
+        if len(items) > 1:
+            current, current_size = [], 0
+            for item in items:
+                item_size = len(item.encode()) + 1
+                if current and current_size + item_size > self.digest_chunk_bytes:
+                    chunks.append("\n".join(current))
+                    current, current_size = [], 0
+                current.append(item)
+                current_size += item_size
+            chunks.append("\n".join(current))
+        else:
+            chunks = [result_text[i:i + self.digest_chunk_bytes]
+                      for i in range(0, len(result_text), self.digest_chunk_bytes)]
+        
+        semaphore = asyncio.Semaphore(self.digest_concurrency)
+        
+        async def summarize(prompt: str) -> Tuple[str, float]:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await self._model_request(
+                    self.backend.start_chat([]),
+                    prompt,
+                    generation_config={"temperature": 0.2}
+                )
+                elapsed = time.perf_counter() - start
+                self._record_usage(response, elapsed, "digest")
+                return _response_text(response), elapsed
+        
+        start = time.perf_counter()
+        try:
+            digests = await asyncio.gather(*(summarize(
+                f"""The user asked: {self.turn_query}
+
+Below is part {index + 1} of {len(chunks)} of the output of the tool '{name}'.
+Extract the information relevant to the user's request. Keep exact names,
+identifiers, dates and numbers. Be concise; reply "nothing relevant" if nothing is.
+
+{chunk}"""
+            ) for index, chunk in enumerate(chunks)))
+            digest = "\n\n".join(text for text, _ in digests)
+            call_time = sum(elapsed for _, elapsed in digests)
+            
+            if len(digests) > 1 and len(digest.encode()) > budget:
+                digest, elapsed = await summarize(
+                    f"""The user asked: {self.turn_query}
+
+Merge these partial digests of the output of the tool '{name}' into one concise digest.
+Keep exact names, identifiers, dates and numbers relevant to the user's request.
+
+{digest}"""
+                )
+                call_time += elapsed
+        except Exception as e:
+            console.print(f"[bold red]Error digesting tool result: {str(e)}[/bold red]")
+            return None
+        
+        wall_time = time.perf_counter() - start
+        # Single-shot would put the whole result in the main conversation
+        single_shot_tokens = len(result_text) // HistoryManager.CHARS_PER_TOKEN
+        digest_tokens = len(digest) // HistoryManager.CHARS_PER_TOKEN
+        timings = self.last_turn_timings
+        timings["digest_chunks"] = timings.get("digest_chunks", 0) + len(chunks)
+        timings["digest_wall_time"] = timings.get("digest_wall_time", 0.0) + wall_time
+        timings["digest_sequential_time"] = timings.get("digest_sequential_time", 0.0) + call_time
+        timings["digest_single_shot_tokens"] = timings.get("digest_single_shot_tokens", 0) + single_shot_tokens
+        timings["digest_tokens"] = timings.get("digest_tokens", 0) + digest_tokens
+        console.print(
+            f"[dim]Digested {name}: {len(result_text.encode())} bytes in {len(chunks)} chunk(s), "
+            f"{wall_time:.2f}s (sequential {call_time:.2f}s); "
+            f"~{single_shot_tokens} tokens single-shot vs ~{digest_tokens} in the conversation[/dim]"
+        )
+        return digest
+    
+    def _expand_result_tool(self) -> types.Tool:
+        """Local tool that pages through full results that were truncated"""
+        return types.Tool(
+            name=EXPAND_RESULT_TOOL,
+            description="Read part of a tool result that was truncated. "
+                        "Returns `length` characters starting at `offset`.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "result_id": {"type": "string", "description": "Id from the truncation note"},
+                    "offset": {"type": "integer", "description": "Character offset to start at (default 0)"},
+                    "length": {"type": "integer", "description": f"Characters to return (default {self.result_budget})"}
+                },
+                "required": ["result_id"]
+            }
+        )
+    
+    async def _call_tool(self, name: str, parameters: Dict[str, Any]) -> Tuple[str, bool]:
+        """Route a tool call to its server, serving read-only tools from cache
+
+        Returns the flattened result text and whether it came from the cache.
+        """
+        if name == EXPAND_RESULT_TOOL:
+            result_id = parameters.get("result_id")
+            if result_id not in self.full_results:
+                raise ValueError(f"Unknown or expired result id '{result_id}'")
+            offset = int(parameters.get("offset", 0))
+            full_text = self.full_results[result_id]
+            # Pages are capped at the default budget, unless that is off
+            page = self.result_budget if self.result_budget > 0 else len(full_text)
+            length = min(int(parameters.get("length", page)), page)
+            return (f"{full_text[offset:offset + length]}\n"
+                    f"[Characters {offset}-{min(offset + length, len(full_text))} of {len(full_text)}]"), False
+        
+        if name not in self.tool_routes:
+            raise ValueError(f"Unknown tool '{name}'")
+        server, tool_name = self.tool_routes[name]
+        parameters = _decode_json_arguments(self.tool_schemas.get(name, {}), parameters)
+        
+        if name not in self.read_only_tools:
+            result = await self._session_call_tool(server, tool_name, parameters, idempotent=False)
+            # The call may have changed what the server's read-only tools return
+            self.tool_result_cache.invalidate_server(server.name)
+            return _tool_result_text(result), False
+        
+        key = (server.name, tool_name, _canonical_args(parameters))
+        cached = self.tool_result_cache.get(key)
+        if cached is not None:
+            return cached, True
+        
+        # Read-only tools are safe to retry after a server restart
+        result = await self._session_call_tool(server, tool_name, parameters, idempotent=True)
+        result_text = _tool_result_text(result)
+        if not result.isError:
+            self.tool_result_cache.put(key, result_text)
+        return result_text, False
+    
+    async def _session_call_tool(self, server: MCPServer, tool_name: str, parameters: Dict[str, Any],
+                                 idempotent: bool) -> types.CallToolResult:
+        """Call a tool on its server inside a trace span"""
+        with self.tracer.span("call_tool", server=server.name, tool=tool_name) as span:
+            result = await server.call_tool(tool_name, parameters, idempotent=idempotent)
+            if self.tracer.enabled:
+                span.set(request_bytes=len(json.dumps(parameters, default=str).encode()),
+                         response_bytes=len(_tool_result_text(result).encode()),
+                         is_error=bool(result.isError))
+            return result
+    
+    def _function_declarations(self, tools: List[types.Tool]) -> genai.protos.Tool:
+        """Convert MCP tools to a Gemini tool of function declarations"""
+        return genai.protos.Tool(function_declarations=[
+            genai.types.FunctionDeclaration(
+                name=tool.name,
+                description=tool.description or "",
+                parameters=_gemini_schema(tool.inputSchema) if tool.inputSchema.get("properties") else None
+            ).to_proto()
+            for tool in tools
+        ])
+
+    async def chat_with_gemini(self, query: str) -> str:
+        """Chat directly with Gemini without using MCP tools"""
+        with self.tracer.span("chat_with_gemini", request_bytes=len(query.encode())) as span:
+            try:
+                await self._begin_turn(query)
+                chat = self.chat
+                
+                # The system prompt is the chat's system instruction
+                response = await self._send_message(
+                    chat,
+                    [query],
+                    generation_config={"temperature": 0.7}
+                )
+                
+                response_text = response.text
+                span.set(response_bytes=len(response_text.encode()))
+                return response_text
+                    
+            except Exception as e:
+                self._rewind_turn()
+                console.print(f"[bold red]Error: {str(e)}[/bold red]")
+                return f"Error: {str(e)}"
+            finally:
+                self._end_turn()
             
-    async def list_tools(self):
+    async def list_tools(self, refresh: bool = False):
         """List available tools from connected MCP servers"""
-        if not self.session:
+        await self.wait_for_servers()
+        if not self.servers:
             return "Not connected to any MCP server. Use '/connect <path_to_server>' first."
             
-        response = await self.session.list_tools()
-        tools = response.tools
+        tools = await self.get_tools(refresh=refresh)
         
         result = "Available MCP Tools:\n\n"
         for tool in tools:
             result += f"• {tool.name}: {tool.description}\n"
+        
+        result += (f"\nCatalog cache: {self.tool_cache_hits} hits "
+                   f"({self.tool_cache_hits} list_tools round trips saved), "
+                   f"{self.tool_cache_fetches} fetches")
             
         return result
     
@@ -256,41 +2685,56 @@ Please analyze this result and provide a helpful response to the user based on t
         Model Context Protocol Client
         
         Commands:
-        • '/connect <path_to_server>' - Connect to an MCP server
+        • '/connect <path_to_server> [...]' - Connect to one or more MCP servers
         • '/tools' - List available MCP tools
+        • '/tools refresh' - Refetch the tool list from the server
+        • '/stats' - Show session statistics
         • '/help' - Show help information
         • '/exit' or '/quit' - Exit the application
         
         Start chatting directly with Napier!
         """
         console.print(Panel(welcome_message, border_style="blue"))
-
+        
         while True:
             try:
-                if self.connected_server:
-                    prompt = f"[bold blue]Napier[/bold blue] ({os.path.basename(self.connected_server)}) > "
+                if self.servers:
+                    prompt = f"[bold blue]Napier[/bold blue] ({', '.join(self.servers)}) > "
+                elif self.connecting and not self.connecting.done():
+                    prompt = "[bold blue]Napier[/bold blue] (connecting...) > "
                 else:
                     prompt = "[bold blue]Napier[/bold blue] > "
                     
-                user_input = Prompt.ask(prompt)
+                _mark_startup("first prompt")
+                user_input = await self._ask(prompt)
                 
                 if user_input.lower() in ['/exit', '/quit']:
                     console.print("[yellow]Exiting Napier...[/yellow]")
                     break
                 
                 elif user_input.lower().startswith('/connect '):
-                    server_path = user_input[9:].strip()
-                    await self.connect_to_server(server_path)
+                    # Quoted paths may contain spaces
+                    try:
+                        server_paths = shlex.split(user_input[9:])
+                    except ValueError as e:
+                        console.print(f"[bold red]Error: {str(e)}[/bold red]")
+                        continue
+                    await self.connect_to_servers(server_paths)
                     
-                elif user_input.lower() == '/tools':
-                    tools_info = await self.list_tools()
+                elif user_input.lower() in ['/tools', '/tools refresh']:
+                    tools_info = await self.list_tools(refresh=user_input.lower() == '/tools refresh')
                     console.print(Panel(tools_info, title="Available Tools", border_style="green"))
                     
+                elif user_input.lower() == '/stats':
+                    console.print(Panel(self.stats_report(), title="Session Stats", border_style="green"))
+                    
                 elif user_input.lower() == '/help':
                     help_text = """
                     Available commands:
-                    • '/connect <path_to_server>' - Connect to an MCP server
+                    • '/connect <path_to_server> [...]' - Connect to one or more MCP servers
                     • '/tools' - List available MCP tools
+                    • '/tools refresh' - Refetch the tool list from the server
+                    • '/stats' - Show session statistics
                     • '/help' - Display this help message
                     • '/exit' or '/quit' - Exit the application
                     
@@ -301,7 +2745,8 @@ Please analyze this result and provide a helpful response to the user based on t
                     console.print(Panel(help_text, title="Napier Help", border_style="green"))
                     
                 elif user_input.lower().startswith('/use ') and user_input.strip() != '/use':
-                    if not self.session:
+                    await self.wait_for_servers()
+                    if not self.servers:
                         console.print("[bold yellow]Not connected to any MCP server. Use '/connect <path_to_server>' first.[/bold yellow]")
                         continue
                         
@@ -315,30 +2760,293 @@ Please analyze this result and provide a helpful response to the user based on t
                     query = f"I want to use the '{tool_name}' tool to {parts[1]}"
                         
                     response = await self.process_query(query)
-                    console.print(Panel(Markdown(response), title="AI Response", border_style="cyan"))
+                    self._render_response(response)
                 
                 elif user_input.strip() and user_input.startswith('/'):
                     console.print("[bold yellow]Unknown command. Type '/help' for assistance.[/bold yellow]")
                 
                 elif user_input.strip():
-                    # Check if connected to MCP server and use it if available
-                    if self.session:
+                    # Check if connected to MCP server and use it if available,
+                    # a query during a background connect waits for the servers
+                    await self.wait_for_servers()
+                    if self.servers:
                         response = await self.process_query(user_input)
                     else:
                         # Direct chat with Gemini
                         response = await self.chat_with_gemini(user_input)
                         
-                    console.print(Panel(Markdown(response), title="AI Response", border_style="cyan"))
+                    self._render_response(response)
                     
             except Exception as e:
                 console.print(f"[bold red]Error: {str(e)}[/bold red]")
 
+    async def _ask(self, prompt: str) -> str:
+        """Read a line of input without blocking the event loop
+        
+        The prompt is read on a daemon thread, so background work such as a
+        server connection keeps running while the user types.
+        """
+        from rich.prompt import Prompt
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def deliver(result=None, error=None):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        def read():
+            try:
+                result = Prompt.ask(prompt)
+            except BaseException as e:
+                loop.call_soon_threadsafe(deliver, None, e)
+            else:
+                loop.call_soon_threadsafe(deliver, result)
+        
+        threading.Thread(target=read, daemon=True).start()
+        return await future
+    
+    def fork(self) -> "NapierClient":
+        """Start an independent conversation sharing this client's servers and backend"""
+        clone = copy.copy(self)
+        clone._chat = None
+        clone._chat_key = None
+        clone.chat_cached = False
+        clone.chat_preamble = None
+        clone.history = HistoryManager(self.backend, self.history.token_budget, self.history.keep_turns,
+                                       self.scheduler)
+        clone.last_turn_timings = {}
+        clone.last_turn_tool_calls = []
+        clone.last_turn_usage = {}
+        clone.last_turn_model_calls = []
+        # Result ids are per conversation, so forks must not share the store
+        clone.full_results = OrderedDict()
+        clone.result_counter = 0
+        return clone
+    
+    async def run_batch(self, queries: List[str], workers: int, output) -> None:
+        """Run independent queries concurrently and write one JSONL record per query
+
+        Every query gets its own conversation, while all of them share the
+        connected MCP servers. At most `workers` queries run at once and records
+        are written in completion order.
+
+        Args:
+            queries: Queries to run
+            workers: Maximum number of concurrent conversations
+            output: Text stream the JSONL records are written to
+        """
+        semaphore = asyncio.Semaphore(max(workers, 1))
+        
+        async def run(index: int, query: str) -> None:
+            async with semaphore:
+                conversation = self.fork()
+                conversation.request_priority = RequestScheduler.BACKGROUND
+                start = time.perf_counter()
+                try:
+                    if self.servers:
+                        answer = await conversation.process_query(query)
+                    else:
+                        answer = await conversation.chat_with_gemini(query)
+                except Exception as e:
+                    # One failed query (e.g. a server restarting) must not end the batch
+                    console.print(f"[bold red]Query {index} failed: {str(e)}[/bold red]")
+                    output.write(json.dumps({"index": index, "query": query, "error": str(e)}) + "\n")
+                    output.flush()
+                    return
+                record = {
+                    "index": index,
+                    "query": query,
+                    "answer": answer,
+                    "tool_calls": conversation.last_turn_tool_calls,
+                    "timings": {"total": time.perf_counter() - start, **conversation.last_turn_timings},
+                    "usage": conversation.last_turn_usage,
+                    "model_calls": conversation.last_turn_model_calls
+                }
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(run(index, query) for index, query in enumerate(queries)))
+        elapsed = time.perf_counter() - start
+        console.print(f"[green]Ran {len(queries)} queries in {elapsed:.2f}s "
+                      f"({len(queries) / max(elapsed, 1e-9):.2f} queries/s)[/green]")
+        console.print(Panel(self.turn_stats_report(), title="Batch Stats", border_style="green"))
+    
+    def turn_stats_report(self) -> str:
+        """Session token totals and per-phase latency percentiles"""
+        records = self.turn_records
+        if not records:
+            return "[bold]Turns[/bold]\n• No turns yet"
+        
+        usage = {}
+        for record in records:
+            for key, count in record["usage"].items():
+                usage[key] = usage.get(key, 0) + count
+        lines = [
+            "[bold]Turns[/bold]",
+            f"• Turns: {len(records)}, model calls: {sum(len(r['model_calls']) for r in records)}, "
+            f"tool calls: {sum(len(r['tool_calls']) for r in records)}",
+            f"• Tokens: {usage.get('prompt_token_count', 0)} prompt, "
+            f"{usage.get('candidates_token_count', 0)} output, {usage.get('total_token_count', 0)} total",
+            "",
+            "[bold]Latency (p50 / p95 / p99)[/bold]"
+        ]
+        for phase in TURN_PHASES:
+            samples = [record["timings"][phase] for record in records if phase in record["timings"]]
+            if samples:
+                lines.append(
+                    f"• {phase}: {_percentile(samples, 50):.3f}s / "
+                    f"{_percentile(samples, 95):.3f}s / {_percentile(samples, 99):.3f}s"
+                )
+        return "\n".join(lines)
+    
+    def stats_report(self) -> str:
+        """Summarize session statistics for the '/stats' command"""
+        history = self.history.stats(self.chat_history)
+        report = (
+            f"{self.turn_stats_report()}\n\n"
+            f"[bold]History[/bold]\n"
+            f"• Turns: {history['turns']} ({history['messages']} messages)\n"
+            f"• Size: ~{history['tokens']} tokens of {history['token_budget']} budget, {history['bytes']} bytes\n"
+            f"• Compactions: {history['compactions']} ({history['summarized_turns']} turns summarized)"
+        )
+        results = self.tool_result_cache.stats()
+        report += (
+            f"\n\n[bold]Tool result cache[/bold]\n"
+            f"• Hits: {results['hits']}, misses: {results['misses']}\n"
+            f"• Entries: {results['entries']} ({results['bytes']} of {self.tool_result_cache.max_bytes} bytes)"
+        )
+        scheduler = self.scheduler.stats()
+        report += (
+            f"\n\n[bold]Model requests[/bold]\n"
+            f"• Requests: {scheduler['requests']}, retries: {scheduler['retries']}, "
+            f"queued: {scheduler['queued']}\n"
+            f"• Waiting for rate limits: {scheduler['wait_time']:.2f}s "
+            f"(limits: {self.scheduler.rpm or 'no'} RPM, {self.scheduler.tpm or 'no'} TPM)"
+        )
+        if self.servers:
+            report += "\n\n[bold]MCP servers[/bold]"
+            for name, server in self.servers.items():
+                health = server.health()
+                report += (
+                    f"\n• {name}: {'up' if health['up'] else 'down'}, "
+                    f"reconnects: {health['reconnects']}, downtime: {health['downtime']:.2f}s"
+                )
+        if self.context_cache:
+            cache = self.context_cache.stats()
+            report += (
+                f"\n\n[bold]Context cache[/bold]\n"
+                f"• Prefix reuses: {cache['hits']}, registered: {cache['creates']}, entries: {cache['entries']}"
+            )
+        if self.plan_cache:
+            plans = self.plan_cache.stats()
+            report += (
+                f"\n\n[bold]Plan cache[/bold]\n"
+                f"• Hits: {plans['hits']} (planning calls skipped), misses: {plans['misses']}\n"
+                f"• Entries: {plans['entries']}"
+            )
+        return report
+    
+    def _render_response(self, response: str) -> None:
+        """Render a turn's response and record the rendering time"""
+        from rich.markdown import Markdown
+        
+        start = time.perf_counter()
+        console.print(Panel(Markdown(response), title="AI Response", border_style="cyan"))
+        self.last_turn_timings["rendering"] = time.perf_counter() - start
+        self._print_turn_latency()
+    
+    def _print_turn_latency(self) -> None:
+        """Show time to first and last token for a streamed turn"""
+        timings = self.last_turn_timings
+        if self.streaming and "time_to_first_token" in timings:
+            console.print(
+                f"[dim]First token {timings['time_to_first_token']:.2f}s, "
+                f"last token {timings['time_to_last_token']:.2f}s[/dim]"
+            )
+
     async def cleanup(self):
         """Clean up resources"""
+        if self.connecting and not self.connecting.done():
+            self.connecting.cancel()
+            await asyncio.gather(self.connecting, return_exceptions=True)
         await self.exit_stack.aclose()
+        if self.tracer.enabled:
+            self.tracer.save()
+            console.print(f"[dim]Trace written to {self.tracer.path}[/dim]")
         console.print("[green]Resources cleaned up.[/green]")
 
-async def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        prog="napier",
+        description="Napier - Chat with AI and connect to third-party apps"
+    )
+    parser.add_argument("servers", nargs="*", help="MCP server scripts (.py or .js) to connect to")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print import and startup costs on exit")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run each line of FILE ('-' for stdin) as an independent query and exit")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of concurrent queries in batch mode (default 4)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write batch JSONL records to FILE instead of stdout")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run a daemon that keeps the given MCP servers warm for later invocations")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write Chrome trace-event spans for every turn to FILE")
+    parser.add_argument("--version", action="version", version="Napier 1.0.0")
+    return parser.parse_args(argv)
+
+async def run_batch(args: argparse.Namespace):
+    """Headless entry point for --batch"""
+    # Keep stdout for JSONL records, progress and errors go to stderr
+    console.file = sys.stderr
+    
+    if args.batch == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.batch) as f:
+            lines = f.read().splitlines()
+    queries = [line.strip() for line in lines if line.strip()]
+    
+    client = NapierClient()
+    client.streaming = False
+    if args.trace:
+        client.tracer = Tracer(args.trace)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        if args.servers:
+            await client.connect_to_servers(args.servers)
+        await client.run_batch(queries, args.workers, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await client.cleanup()
+
+async def run_daemon(args: argparse.Namespace):
+    """Entry point for --daemon"""
+    # Load environment variables from .env file, as NapierClient does
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    daemon = NapierDaemon(_default_socket_path())
+    # Shut down cleanly (servers closed, socket removed) on SIGTERM too
+    import signal
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await daemon.serve(args.servers)
+    except RuntimeError as e:
+        console.print(f"[bold red]Error: {str(e)}[/bold red]")
+    except asyncio.CancelledError:
+        console.print("[yellow]Napier daemon stopped.[/yellow]")
+
+async def main(args: argparse.Namespace):
     """Main entry point"""
     # Display ASCII art banner
     banner = """
@@ -353,12 +3061,16 @@ async def main():
     console.print("[bold]Napier[/bold] - Chat with AI and connect to third-party apps")
     console.print("Type '/help' for available commands")
     console.print("Version 1.0.0\n")
+    _mark_startup("banner")
 
     client = NapierClient()
+    if args.trace:
+        client.tracer = Tracer(args.trace)
     try:
-        # If a server path is provided as an argument, connect to it
-        if len(sys.argv) > 1:
-            await client.connect_to_server(sys.argv[1])
+        # If server paths are provided as arguments, connect to all of them
+        # in the background so the prompt shows up right away
+        if args.servers:
+            client.connect_in_background(args.servers)
         
         # Start the chat loop
         await client.chat_loop()
@@ -366,7 +3078,14 @@ async def main():
         await client.cleanup()
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        asyncio.run(main())
+        if args.daemon:
+            asyncio.run(run_daemon(args))
+        else:
+            asyncio.run(run_batch(args) if args.batch else main(args))
     except KeyboardInterrupt:
-        console.print("\n[yellow]Keyboard interrupt detected. Exiting Napier...[/yellow]")
\ No newline at end of file
+        console.print("\n[yellow]Keyboard interrupt detected. Exiting Napier...[/yellow]")
+    finally:
+        if args.startup_profile:
+            print_startup_profile()